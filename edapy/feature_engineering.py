@@ -1,4 +1,32 @@
+import os
+import numpy as np
 import pandas as pd
+from .utils import lookup_date
+
+
+def _streaks(codes, days):
+    """
+    Number of consecutive previous days each (ID, day) was active, counted per ID.
+
+    Arguments:
+        codes {np.ndarray} -- integer code of the ID of every row
+        days {np.ndarray} -- integer day of every row, larger is later
+
+    Returns:
+        streaks {np.ndarray} -- streak of every row, 0 when the ID was not active the day before
+    """
+    # Unique (ID, day) pairs sorted by ID then day, computed with a single sort
+    days = days - days.min(initial=0)
+    span = days.max(initial=0) + 1
+    keys, inverse = np.unique(codes * span + days, return_inverse=True)
+    key_codes, key_days = keys // span, keys % span
+
+    # A day continues the run of the previous one if it is the next day of the same ID
+    idx = np.arange(len(keys))
+    cont = np.zeros(len(keys), dtype=bool)
+    cont[1:] = (key_codes[1:] == key_codes[:-1]) & (key_days[1:] - key_days[:-1] == 1)
+    run_start = np.maximum.accumulate(np.where(cont, 0, idx))
+    return (idx - run_start)[inverse.reshape(-1)]
 
 
 def add_consecutive_days(df, col_ID, col_date, col_consecutive='consecutive'):
@@ -14,38 +42,250 @@ def add_consecutive_days(df, col_ID, col_date, col_consecutive='consecutive'):
         col_consecutive {String} -- name of result column
     """
 
-    # Convert date column to pd.DateTime format
-    df[col_date] = pd.to_datetime(df[col_date])
+    # Convert date column to pd.DateTime format, repeated dates are parsed once
+    df[col_date] = lookup_date(df[col_date])
+
+    # Day number, counted backward from the last transaction like the date diff in days
+    date_diff = (df[col_date].max() - df[col_date]).dt.days
+    codes, _ = pd.factorize(df[col_ID])
+    valid = (codes >= 0) & date_diff.notnull().values
+
+    # Sort once by ID and day, then number each day of a run of consecutive days
+    res = np.zeros(df.shape[0], dtype=np.int64)
+    res[valid] = _streaks(codes[valid], -date_diff.values[valid].astype(np.int64))
+    df[col_consecutive] = pd.Series(res, index=df.index).where(valid)
+
+
+def _load_streak_state(filename):
+    """Read the per-ID streak state written by `_save_streak_state`, empty if the file does not exist."""
+    if not os.path.exists(filename):
+        return pd.DataFrame({'ID': [], 'last_day': np.array([], dtype=np.int64),
+                             'streak': np.array([], dtype=np.int64)})
+    if filename.endswith('.parquet'):
+        return pd.read_parquet(filename)
+    with np.load(filename, allow_pickle=True) as f:
+        return pd.DataFrame({'ID': f['ID'], 'last_day': f['last_day'], 'streak': f['streak']})
+
+
+def _save_streak_state(state, filename):
+    """Write the per-ID streak state to parquet, or to a numpy .npz archive for any other extension."""
+    if filename.endswith('.parquet'):
+        state.to_parquet(filename, index=False)
+    else:
+        with open(filename, 'wb') as f:
+            np.savez(f, ID=state['ID'].to_numpy(), last_day=state['last_day'].to_numpy(),
+                     streak=state['streak'].to_numpy())
+
+
+def update_consecutive_days(df, col_ID, col_date, state_file, col_consecutive='consecutive'):
+    """
+    Incremental version of `add_consecutive_days`, for transactions arriving in daily batches.
+
+    A compact state, the last active day and the streak at that day of every ID, is kept in
+    `state_file`. The batch is computed from that state only, so the cost depends on the size
+    of the batch and the number of IDs, not on the whole transaction history. The first call,
+    without a state file, may be given the full history to build the state.
+
+    Days are calendar days, which is the same as `add_consecutive_days` when the dates have no
+    time of day.
+
+    Arguments:
+        df {pd.DataFrame} -- new batch of transactions, not older than the last day of the state
+        col_ID {String} -- column of unique user ID
+        col_date {String} -- column of timestamp or datetime identifying when the transaction occurs
+        state_file {String} -- .parquet or .npz file of the state, updated in place
+
+    Keyword Arguments:
+        col_consecutive {String} -- name of result column
+    """
+    df[col_date] = lookup_date(df[col_date])
+    state = _load_streak_state(state_file)
+
+    days = (df[col_date].dt.normalize() - pd.Timestamp(0)).dt.days
+    codes, uniques = pd.factorize(df[col_ID])
+    valid = (codes >= 0) & days.notnull().values
+    codes, days = codes[valid], days.values[valid].astype(np.int64)
+
+    res = np.zeros(df.shape[0], dtype=np.int64)
+    if valid.any():
+        streaks = _streaks(codes, days)
+
+        # Carry the stored streak over to the run starting at the first day of each ID in the batch
+        first_day = pd.Series(days).groupby(codes).transform('min').values
+        stored = pd.Index(state['ID']).get_indexer(uniques)[codes]
+        known = np.flatnonzero(stored >= 0)
+        gap = first_day[known] - state['last_day'].values[stored[known]]
+        if (gap < 0).any():
+            raise ValueError("Batch contains transactions older than the last day of the state.")
+        carry = np.zeros(len(codes), dtype=np.int64)
+        carry[known] = np.where(gap <= 1, state['streak'].values[stored[known]] + gap, 0)
+        streaks = streaks + np.where(days - streaks == first_day, carry, 0)
+        res[valid] = streaks
+
+        # New state: the last day of every ID of the batch, and the streak at that day
+        latest = pd.DataFrame({'code': codes, 'last_day': days, 'streak': streaks})
+        latest = latest.sort_values(['code', 'last_day']).drop_duplicates('code', keep='last')
+        latest.insert(0, 'ID', uniques.take(latest.pop('code').values))
+        state = pd.concat([state[~state['ID'].isin(latest['ID'])], latest], ignore_index=True)
+
+    _save_streak_state(state, state_file)
+    df[col_consecutive] = pd.Series(res, index=df.index).where(valid)
+
+
+def _window_sums(v, notnull, left, right):
+    """
+    Sums of d and d * d over the non-null rows [left, right) of every window, d being v minus
+    `center`, a value of the window.
+
+    Rows are combined with a disjoint sparse table: at level k, the rows are cut into blocks of
+    2 ** (k + 1) rows, and every block holds the sums from each row of its first half to the middle
+    and from the middle to each row of its second half. A window whose first and last rows are
+    in different halves of a block of level k is the sum of two of those, so no sum ever includes
+    rows outside the window, and the values are centered on the row next to the middle, which is
+    in the window. A large value earlier in the history does not cost the precision of later windows.
+    """
+    n = len(v)
+    size = 1 << max(int(n - 1).bit_length(), 1)
+    filled = pd.Series(np.where(notnull, v, np.nan)).ffill().bfill().fillna(0).to_numpy()
+    padded = np.zeros(size)
+    padded[:n] = np.where(notnull, v, 0)
+    mask = np.zeros(size)
+    mask[:n] = notnull
+
+    first, last = left, right - 1
+    s_d, sq_d = np.zeros(n), np.zeros(n)
+    center = np.where(first == last, filled[last], np.nan)
+    level = np.zeros(n, dtype=np.int64)
+    diff = first ^ last
+    level[diff > 0] = np.floor(np.log2(diff[diff > 0])).astype(np.int64)
+    for k in np.unique(level[diff > 0]):
+        half = 1 << int(k)
+        c = np.repeat(filled[np.minimum(np.arange(half, size, 2 * half), n - 1)], 2 * half)
+        x = ((padded - c) * mask).reshape(-1, 2, half)
+        sums = []
+        for y in [x, x * x]:
+            suffix = np.cumsum(y[:, 0, ::-1], axis=1)[:, ::-1].ravel()
+            prefix = np.cumsum(y[:, 1, :], axis=1).ravel()
+            sums.append((suffix, prefix))
+        q = np.flatnonzero((level == k) & (diff > 0))
+        # Position of the first row in the first halves, and of the last row in the second halves
+        lq = (first[q] >> (k + 1)) * half + (first[q] & (half - 1))
+        rq = (last[q] >> (k + 1)) * half + (last[q] & (half - 1))
+        s_d[q] = sums[0][0][lq] + sums[0][1][rq]
+        sq_d[q] = sums[1][0][lq] + sums[1][1][rq]
+        center[q] = c[first[q]]
+    return s_d, sq_d, center
+
+
+def add_window_features(df, col_ID, col_date, cols_value=(), windows=(1, 7, 30),
+                        aggs=('count', 'sum', 'mean', 'std', 'active_days', 'recency', 'streak', 'nunique')):
+    """
+    Add many windowed transaction features per ID in one pass over the data sorted by ID and date.
+
+    Windows are calendar days: the `w` days window of a transaction covers its own day and the
+    `w - 1` days before, up to and including the transaction itself. Window bounds are found with
+    a binary search on the sorted (ID, day) keys, counts come from cumulative sums and value sums
+    from `_window_sums`, which only adds the rows of each window. No ID is ever filtered on its own.
+
+    Arguments:
+        df {pd.DataFrame} -- typically transaction dataframe
+        col_ID {String} -- column of unique user ID
+        col_date {String} -- column of timestamp or datetime identifying when the transaction occurs
+
+    Keyword Arguments:
+        cols_value {list} -- numerical columns, e.g. amount, aggregated by 'sum', 'mean', 'std' and 'nunique'
+        windows {list} -- window lengths in days
+        aggs {list} -- features to compute:
+            'count' -- `count_{w}d`, number of transactions in the window
+            'sum', 'mean', 'std' -- `{col}_{agg}_{w}d` of every value column in the window, nulls skipped
+            'active_days' -- `active_days_{w}d`, number of distinct days with a transaction in the window
+            'recency' -- `recency`, days since the previous transaction of the ID
+            'streak' -- `streak`, consecutive days before the transaction day, see `add_consecutive_days`
+            'nunique' -- `{col}_nunique_{w}d`, distinct non-null values of every value column in the window
+    """
+    supported = ['count', 'sum', 'mean', 'std', 'active_days', 'recency', 'streak', 'nunique']
+    if any(agg not in supported for agg in aggs):
+        raise ValueError("Unknown aggregation. Supported aggregations are {}.".format(supported))
+
+    df[col_date] = lookup_date(df[col_date])
+    codes, _ = pd.factorize(df[col_ID])
+    valid = (codes >= 0) & df[col_date].notnull().values
+
+    # Sort once by ID then timestamp, every feature below is computed on this order
+    ts = df[col_date].values.astype('datetime64[ns]').astype(np.int64)
+    order = np.flatnonzero(valid)
+    order = order[np.lexsort((ts[order], codes[order]))]
+    ts, codes = ts[order], codes[order]
+    days = (df[col_date].dt.normalize() - pd.Timestamp(0)).dt.days.values[order].astype(np.int64)
+    idx = np.arange(len(order))
+
+    features = {}
 
-    # Create date diff in days column
-    df['date_diff'] = (max(df[col_date]) - df[col_date])
-    df['date_diff'] = [x.days for x in df['date_diff']]
+    def scatter(name, values):
+        res = np.zeros(df.shape[0], dtype=values.dtype)
+        res[order] = values
+        features[name] = pd.Series(res, index=df.index).where(valid)
 
-    # Initialize empty consecutive column
-    df[col_consecutive] = [None] * df.shape[0]
+    # Composite (ID, day) keys, sorted since the rows are, shifted so that day - w stays positive
+    days = days - days.min(initial=0) + max(windows)
+    span = days.max(initial=0) + 1
+    keys = codes * span + days
+    first_of_day = np.ones(len(order), dtype=bool)
+    first_of_day[1:] = keys[1:] != keys[:-1]
+    cum_days = np.concatenate([[0], np.cumsum(first_of_day)])
 
-    for ID in df[col_ID].unique():
-        df_temp = df[df[col_ID] == ID]
+    new_id = np.ones(len(order), dtype=bool)
+    new_id[1:] = codes[1:] != codes[:-1]
 
-        # Sort descending transactional data by date column, get unique date_diff column
-        temp = sorted(df_temp['date_diff'].unique())[::-1]
+    values = {}
+    for col in cols_value:
+        v = df[col].values[order].astype(np.float64)
+        notnull = ~np.isnan(v)
+        values[col] = (np.concatenate([[0], np.cumsum(notnull)]), v, notnull)
 
-        # For each value in temp, calulate the consecutive days
-        res = [0]
-        curr = 0
-        for i in range(len(temp) - 1):
-            if ((temp[i+1] - temp[i]) == -1):
-                curr = curr + 1
-            else:
-                curr = 0
-            res.append(curr)
+        if 'nunique' in aggs:
+            # Previous row of the same (ID, value), -1 if none
+            vcodes, vuniques = pd.factorize(v, use_na_sentinel=True)
+            pairs = np.where(notnull, codes * max(len(vuniques), 1) + vcodes, -1 - idx)
+            by_pair = np.argsort(pairs, kind='stable')
+            prev = np.full(len(order), -1, dtype=np.int64)
+            same = pairs[by_pair[1:]] == pairs[by_pair[:-1]]
+            prev[by_pair[1:][same]] = by_pair[:-1][same]
+            values[col] += (prev,)
 
-        # Create dictionary for mapping it back to the data
-        res2 = [[x1, x2] for x1, x2 in zip(temp, res)]
-        res2 = dict(res2)
+    for w in windows:
+        left = np.searchsorted(keys, keys - w, side='right')
+        right = idx + 1
+        if 'count' in aggs:
+            scatter('count_{}d'.format(w), right - left)
+        if 'active_days' in aggs:
+            scatter('active_days_{}d'.format(w), cum_days[right] - cum_days[left])
+        for col, (cum_n, v, notnull, *distinct) in values.items():
+            n = cum_n[right] - cum_n[left]
+            if any(agg in aggs for agg in ['sum', 'mean', 'std']):
+                s_d, sq_d, center = _window_sums(v, notnull, left, right)
+                s = s_d + n * center
+            with np.errstate(divide='ignore', invalid='ignore'):
+                if 'sum' in aggs:
+                    scatter('{}_sum_{}d'.format(col, w), s)
+                if 'mean' in aggs:
+                    scatter('{}_mean_{}d'.format(col, w), np.where(n > 0, s / n, np.nan))
+                if 'std' in aggs:
+                    var = (sq_d - s_d * s_d / n) / (n - 1)
+                    scatter('{}_std_{}d'.format(col, w), np.where(n > 1, np.sqrt(np.maximum(var, 0)), np.nan))
+            if distinct:
+                # Row j counts in the window [left_i, i] of row i if j <= i and prev[j] < left_i. As left
+                # only grows with i, j counts for every i from max(j, first i with left_i > prev[j]) on,
+                # and every non-null row before left_i counts too, so it is subtracted.
+                prev, = distinct
+                starts = np.maximum(idx, np.searchsorted(left, prev, side='right'))[notnull]
+                counted = np.cumsum(np.bincount(starts, minlength=len(order) + 1))[:-1]
+                scatter('{}_nunique_{}d'.format(col, w), counted - cum_n[left])
 
-        # Finally, create the consecutive columns
-        df.loc[df[col_ID] == ID, [col_consecutive]] = [res2[x] for x in df_temp['date_diff']]
+    if 'recency' in aggs:
+        gap = np.diff(ts, prepend=ts[:1]) / pd.Timedelta(days=1).value
+        scatter('recency', np.where(new_id, np.nan, gap))
+    if 'streak' in aggs:
+        scatter('streak', _streaks(codes, days))
 
-    # Check if the result is correct
-    df.sort_values(by='date_diff', ascending=False)
+    df[list(features)] = pd.DataFrame(features, index=df.index)
@@ -1,14 +1,25 @@
-from collections import Counter
-from .utils import get_unique_tuple
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import shutil
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.sparse import csgraph
 from tqdm.auto import tqdm
+from .utils import _n_jobs
 
 
-def get_complete_edges(df, cols):
+def get_complete_edges(df, cols, n_jobs=None):
     """
     Arguments
     ---------
         df {pd.DataFrame} -- dataframe of contract
         cols {list} -- list of attributes to be checked to
+    Keyword Arguments
+    -----------------
+        n_jobs {int} -- number of processes, columns are spread over them. -1 to use all cpus
     Return
     ------
         d =
@@ -18,29 +29,339 @@ def get_complete_edges(df, cols):
             ...
         }
         d[key][0] represent vertices connected to data at index 0 with `CONNECTION_TYPE` of `key`.
-
+    Rows are grouped by value, null values are connected to nothing.
     """
-    indexes = range(df.shape[0])
+    n_jobs = _n_jobs(n_jobs)
+    if n_jobs == 1:
+        adjacencies = (_column_adjacency(_factorize(df[col], exclude_xna=False)) for col in cols)
+        adjacencies = ((x.indptr, x.indices) for x in adjacencies)
+    else:
+        shm, shape = _share_codes(df, cols, exclude_xna=False)
+        try:
+            with ProcessPoolExecutor(n_jobs) as pool:
+                adjacencies = list(pool.map(_adjacency_task, [(shm.name, shape, i) for i in range(len(cols))]))
+        finally:
+            shm.close()
+            shm.unlink()
+
     d = {}
-    for col in cols:
-        targets = []
-        for n in indexes:
-            source = n
-            same_val = (df[col] == df.loc[source, col]).values
-            target = [i for i, x in enumerate(same_val) if x]
-            try:
-                target.remove(source)
-            except Exception as e:
-                print(e)
-                pass
-            targets.append(target)
-        d[col] = targets
+    for col, (indptr, indices) in zip(cols, adjacencies):
+        d[col] = [x.tolist() for x in np.split(indices, indptr[1:-1])]
     return d
 
-# NEED OPTIMIZATION O(n^2)
+
+def _null_mask(series, exclude_xna=True):
+    """Boolean array of values that never create an edge: nulls and the 'XNA' placeholder."""
+    XNA_mask = series.isnull()
+    if exclude_xna and (series.dtype in ['O', 'str']):
+        XNA_mask = XNA_mask | (series == 'XNA')
+    return np.asarray(XNA_mask, dtype=bool)
+
+
+def _factorize(series, exclude_xna=True):
+    """Integer code of every value of the column, -1 for values that never create an edge."""
+    codes, _ = pd.factorize(series)
+    codes[_null_mask(series, exclude_xna=exclude_xna)] = -1
+    return codes.astype(np.int64, copy=False)
+
+
+def _value_groups(codes):
+    """
+    Group row positions of a column by value code.
+
+    Arguments
+    ---------
+        codes {np.ndarray} -- output of `_factorize`
+    Return
+    ------
+        positions {np.ndarray} -- row positions ordered by group, ascending inside each group
+        offsets {np.ndarray} -- group g is positions[offsets[g]:offsets[g + 1]]
+    Only values shared by at least two rows form a group, null and 'XNA' values are left out.
+    """
+    valid = np.flatnonzero(codes >= 0)
+    sizes = np.bincount(codes[valid])
+    valid = valid[sizes[codes[valid]] > 1]
+    positions = valid[np.argsort(codes[valid], kind='stable')]
+    sizes = sizes[sizes > 1]
+    offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+    return positions.astype(np.int64), offsets
+
+
+def _group_layout(positions, offsets, directed=False):
+    """
+    Per-row view of the value groups, in row order, used to enumerate edges.
+
+    Every grouped row is a source. In directed mode it points to every other row of its group,
+    otherwise only to the rows after it, so each pair is enumerated once.
+
+    Arguments
+    ---------
+        positions {np.ndarray} -- output of `_value_groups`
+        offsets {np.ndarray} -- output of `_value_groups`
+    Keyword Arguments
+    -----------------
+        directed {bool} -- True to enumerate both (a, b) and (b, a)
+    Return
+    ------
+        sources {np.ndarray} -- row positions of the grouped rows, ascending
+        starts {np.ndarray} -- index in `positions` where the group of each source starts
+        ranks {np.ndarray} -- rank of each source inside its group
+        edge_offsets {np.ndarray} -- edges of sources[i] are numbered edge_offsets[i]:edge_offsets[i + 1]
+    """
+    sizes = np.diff(offsets)
+    starts = np.repeat(offsets[:-1], sizes)
+    ranks = np.arange(len(positions)) - starts
+    counts = np.repeat(sizes - 1, sizes)
+    if directed is False:
+        counts = counts - ranks
+    order = np.argsort(positions)
+    edge_offsets = np.concatenate([[0], np.cumsum(counts[order])]).astype(np.int64)
+    return positions[order], starts[order], ranks[order], edge_offsets
+
+
+def _edge_slice(positions, layout, start, stop, directed=False):
+    """
+    Materialize edges number `start` to `stop` of the enumeration defined by `_group_layout`.
+
+    Return
+    ------
+        src {np.ndarray} -- source row positions
+        dst {np.ndarray} -- target row positions
+    """
+    sources, starts, ranks, edge_offsets = layout
+    k = np.arange(start, stop, dtype=np.int64)
+    member = np.searchsorted(edge_offsets, k, side='right') - 1
+    within = k - edge_offsets[member]
+    if directed is True:
+        local = within + (within >= ranks[member])
+    else:
+        local = ranks[member] + 1 + within
+    return sources[member], positions[starts[member] + local]
+
+
+def _incidence_matrix(positions, offsets, n):
+    """
+    Sparse (n rows x n groups) matrix with a one where row i belongs to group g.
+    """
+    groups = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    data = np.ones(len(positions), dtype=np.int64)
+    return sp.csr_matrix((data, (positions, groups)), shape=(n, len(offsets) - 1))
+
+
+def _column_adjacency(codes):
+    """Sparse (n x n) 0/1 adjacency matrix of one column, B @ B.T without the diagonal."""
+    positions, offsets = _value_groups(codes)
+    incidence = _incidence_matrix(positions, offsets, len(codes))
+    adjacency = (incidence @ incidence.T).tocsr()
+    adjacency.setdiag(0)
+    adjacency.eliminate_zeros()
+    adjacency.sort_indices()
+    return adjacency
+
+
+def _limit_groups(positions, offsets, max_group_size, oversize='skip', rng=None):
+    """
+    Apply the oversize policy to groups having more than `max_group_size` rows.
+
+    Arguments
+    ---------
+        positions {np.ndarray} -- output of `_value_groups`
+        offsets {np.ndarray} -- output of `_value_groups`
+        max_group_size {int} -- largest group connected as a clique
+    Keyword Arguments
+    -----------------
+        oversize {str} -- 'skip' drops oversize groups, 'sample' keeps `max_group_size` random rows
+            of them, 'star' connects every row of them to the first row of the group only
+        rng {np.random.Generator} -- random generator for 'sample'
+    Return
+    ------
+        positions, offsets {np.ndarray} -- groups to be connected as cliques
+        star_positions, star_offsets {np.ndarray} -- groups to be connected as stars
+    """
+    if oversize not in ['skip', 'sample', 'star']:
+        raise ValueError(
+            "Unknown oversize policy. Supported policies are ['skip', "
+            "'sample', 'star']."
+        )
+    sizes = np.diff(offsets)
+    big = sizes > max_group_size
+    member_big = np.repeat(big, sizes)
+    star_positions, star_offsets = np.empty(0, dtype=np.int64), np.zeros(1, dtype=np.int64)
+
+    if oversize == 'star':
+        star_positions = positions[member_big]
+        star_offsets = np.concatenate([[0], np.cumsum(sizes[big])]).astype(np.int64)
+    keep = ~member_big
+    if oversize == 'sample':
+        rng = rng or np.random.default_rng()
+        for g in np.flatnonzero(big):
+            chosen = rng.choice(sizes[g], max_group_size, replace=False)
+            keep[offsets[g] + chosen] = True
+        sizes = np.minimum(sizes, max_group_size)
+    else:
+        sizes = sizes[~big]
+    offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+    return positions[keep], offsets, star_positions, star_offsets
+
+
+def _column_graph(codes, directed=False, max_group_size=None, oversize='skip', rng=None):
+    """
+    Everything needed to enumerate the edges of one column, O(number of rows) in memory.
+
+    Return
+    ------
+        graph {tuple} -- (positions, layout, hubs, spokes), consumed by `_n_edges` and `_edge_range`
+    """
+    positions, offsets = _value_groups(codes)
+    star_positions, star_offsets = np.empty(0, dtype=np.int64), np.zeros(1, dtype=np.int64)
+    if max_group_size is not None:
+        positions, offsets, star_positions, star_offsets = _limit_groups(
+            positions, offsets, max_group_size, oversize=oversize, rng=rng
+        )
+    layout = _group_layout(positions, offsets, directed=directed)
+
+    # Star groups: every row is connected to the first row of its group
+    hub_mask = np.zeros(len(star_positions), dtype=bool)
+    hub_mask[star_offsets[:-1]] = True
+    hubs = np.repeat(star_positions[star_offsets[:-1]], np.diff(star_offsets) - 1)
+    spokes = star_positions[~hub_mask]
+    return positions, layout, hubs, spokes
+
+
+def _n_edges(graph, directed=False):
+    """Number of edges of a `_column_graph`."""
+    _, layout, _, spokes = graph
+    return int(layout[-1][-1]) + len(spokes) * (2 if directed is True else 1)
 
 
-def get_tuple_edges(df, cols, directed=False, weight=False):
+def _edge_range(graph, start, stop, directed=False):
+    """
+    Materialize edges number `start` to `stop` of a `_column_graph`, clique edges first then star edges.
+
+    Return
+    ------
+        src {np.ndarray} -- source row positions
+        dst {np.ndarray} -- target row positions
+    """
+    positions, layout, hubs, spokes = graph
+    n_clique = int(layout[-1][-1])
+    src, dst = _edge_slice(positions, layout, min(start, n_clique), min(stop, n_clique), directed=directed)
+    if stop > n_clique:
+        k = np.arange(max(start, n_clique), stop, dtype=np.int64) - n_clique
+        if directed is True:  # (hub, spoke) followed by (spoke, hub)
+            reverse = (k % 2).astype(bool)
+            k = k // 2
+            star_src = np.where(reverse, spokes[k], hubs[k])
+            star_dst = np.where(reverse, hubs[k], spokes[k])
+        else:
+            star_src, star_dst = hubs[k], spokes[k]
+        src, dst = np.concatenate([src, star_src]), np.concatenate([dst, star_dst])
+    return src, dst
+
+
+def _column_rng(seed, i):
+    """Random generator of the i-th column, identical in every process for the same seed."""
+    return np.random.default_rng([seed, i])
+
+
+def _share_codes(df, cols, exclude_xna=True):
+    """
+    Factorize `cols` into a (len(cols) x n) int64 array in shared memory, so pool workers read the
+    codes without the dataframe being pickled. The caller closes and unlinks the block.
+    """
+    shape = (len(cols), df.shape[0])
+    shm = shared_memory.SharedMemory(create=True, size=max(shape[0] * shape[1] * 8, 1))
+    codes = np.ndarray(shape, dtype=np.int64, buffer=shm.buf)
+    for i, col in enumerate(cols):
+        codes[i] = _factorize(df[col], exclude_xna=exclude_xna)
+    del codes
+    return shm, shape
+
+
+_worker = {}  # state of a pool worker: attached shared codes and the last column graph built
+
+
+def _worker_codes(name, shape):
+    if _worker.get('name') != name:
+        shm = _worker.pop('shm', None)
+        _worker.clear()
+        if shm is not None:
+            shm.close()
+        shm = shared_memory.SharedMemory(name=name)
+        _worker.update(name=name, shm=shm, codes=np.ndarray(shape, dtype=np.int64, buffer=shm.buf))
+    return _worker['codes']
+
+
+def _worker_graph(name, shape, i, directed, max_group_size, oversize, seed):
+    codes = _worker_codes(name, shape)
+    if _worker.get('graph_of') != i:
+        _worker['graph'] = _column_graph(
+            codes[i], directed=directed, max_group_size=max_group_size, oversize=oversize,
+            rng=_column_rng(seed, i)
+        )
+        _worker['graph_of'] = i
+    return _worker['graph']
+
+
+def _count_task(graph_args):
+    return _n_edges(_worker_graph(*graph_args), directed=graph_args[3])
+
+
+def _edge_task(args):
+    graph_args, start, stop, weight = args
+    src, dst = _edge_range(_worker_graph(*graph_args), start, stop, directed=graph_args[3])
+    return src * graph_args[1][1] + dst if weight is True else (src, dst)
+
+
+def _adjacency_task(args):
+    name, shape, i = args
+    adjacency = _column_adjacency(_worker_codes(name, shape)[i])
+    return adjacency.indptr, adjacency.indices
+
+
+def _iter_edge_chunks(df, cols, directed=False, weight=False, max_group_size=None, oversize='skip',
+                      seed=None, chunksize=None, n_jobs=1):
+    """
+    Yield (i, chunk) for the edges of every column i of `cols`, in column order.
+
+    A chunk is a (src, dst) pair of row position arrays, or the int64 keys src * n + dst if weight.
+    With n_jobs > 1 the codes are shared with a process pool and every column is split into edge
+    ranges of about the same size, so a single huge column is spread over all the workers too.
+    The chunks come back in the same order as in a single process.
+    """
+    if n_jobs == 1:
+        n = df.shape[0]
+        for i, col in enumerate(cols):
+            graph = _column_graph(
+                _factorize(df[col]), directed=directed, max_group_size=max_group_size, oversize=oversize,
+                rng=_column_rng(seed, i)
+            )
+            n_edges = _n_edges(graph, directed=directed)
+            step = chunksize or max(n_edges, 1)
+            for start in range(0, n_edges, step):
+                src, dst = _edge_range(graph, start, min(start + step, n_edges), directed=directed)
+                yield i, src * n + dst if weight is True else (src, dst)
+        return
+
+    shm, shape = _share_codes(df, cols)
+    try:
+        with ProcessPoolExecutor(n_jobs) as pool:
+            graph_args = [(shm.name, shape, i, directed, max_group_size, oversize, seed) for i in range(len(cols))]
+            counts = list(pool.map(_count_task, graph_args))
+            step = chunksize or max(-(-sum(counts) // (4 * n_jobs)), 2 ** 16)
+            tasks = [
+                (graph_args[i], start, min(start + step, n_edges), weight)
+                for i, n_edges in enumerate(counts) for start in range(0, n_edges, step)
+            ]
+            for task, chunk in zip(tasks, pool.map(_edge_task, tasks)):
+                yield task[0][2], chunk
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def get_tuple_edges(df, cols, directed=False, weight=False, max_group_size=None, oversize='skip',
+                    random_state=None, n_jobs=None):
     """
     Arguments
     ---------
@@ -50,42 +371,521 @@ def get_tuple_edges(df, cols, directed=False, weight=False):
     -----------------
         directed {bool} -- True to create directed graph, False to create undirected graph
         weight {bool} -- True to consider all attributes as same, combining it as weight of edges
+        max_group_size {int} -- groups of equal values larger than this follow the `oversize` policy
+        oversize {str} -- 'skip', 'sample' or 'star', see `iter_tuple_edges`
+        random_state {int} -- seed used by the 'sample' policy
+        n_jobs {int} -- number of processes, columns and large groups are spread over them. -1 to use all cpus
     Return
     ------
-        d {dict} -- dictionary with key of cols, and value of list of tuples of edges (e.g [(1, 2), (2, 3), ...])
+        d {dict} -- dictionary with key of cols, and value of list of tuples of edges (e.g [(1, 2), (2, 3), ...]).
+            If weight is True, d['connection'] is a pd.DataFrame with columns source, target and weight,
+            sorted by source and target row
+    Rows are grouped by value once per column, so the cost grows with the number of edges
+    instead of the square of the number of rows. Undirected edges are (earlier row, later row).
     """
     d = {}
-    weights = []  # calculates weight by counting number of connections
-    for col in tqdm(cols):
-        targets = []
-
-        # Null value data
-        XNA_mask = df[col].isnull()
-        if (df[col].dtype in ['O', 'str']):
-            XNA_mask = XNA_mask | (df[col] == 'XNA')
-
-        # Mark all duplicates as True, keep=False
-        indexes = list(df[~XNA_mask & df[col].duplicated(keep=False)].index)
-
-        for n in tqdm(indexes):
-            source = n
-            same_val = (df[col] == df.loc[source, col])
-            target = [(source, i) for i, x in same_val.items() if x]
-            try:
-                target.remove((source, source))
-            except Exception as e:
-                print(e)
-                pass
-            targets.extend(target)
-
-        if directed is False:  # Create undirected graph: (1, 2) is the same as (2, 1)
-            targets = get_unique_tuple(targets)
-        if weight is True:
-            weights.extend(targets)
-        else:
-            d[col] = targets
+    n = df.shape[0]
+    seed = np.random.SeedSequence(random_state).entropy
+    chunks = [[] for _ in cols]
+    for i, chunk in tqdm(_iter_edge_chunks(df, cols, directed=directed, weight=weight, max_group_size=max_group_size,
+                                           oversize=oversize, seed=seed, n_jobs=_n_jobs(n_jobs))):
+        chunks[i].append(chunk)
 
     if weight is True:
-        c = Counter(x for x in weights)
-        d['connection'] = [(x, y, val) for (x, y), val in c.items()]
+        # calculates weight by counting number of connections, every edge being encoded as a single
+        # int64 source * n + target, sort and reduce over the keys
+        keys = np.concatenate([np.empty(0, dtype=np.int64)] + [x for col_chunks in chunks for x in col_chunks])
+        keys, counts = np.unique(keys, return_counts=True)
+        d['connection'] = pd.DataFrame({
+            'source': df.index.take(keys // n),
+            'target': df.index.take(keys % n),
+            'weight': counts,
+        })
+    else:
+        for col, col_chunks in zip(cols, chunks):
+            src = np.concatenate([np.empty(0, dtype=np.int64)] + [x for x, _ in col_chunks])
+            dst = np.concatenate([np.empty(0, dtype=np.int64)] + [y for _, y in col_chunks])
+            d[col] = list(zip(df.index.take(src).tolist(), df.index.take(dst).tolist()))
     return d
+
+
+def iter_tuple_edges(df, cols, directed=False, chunksize=1000000, max_group_size=None, oversize='skip',
+                     random_state=None):
+    """
+    Generator version of `get_tuple_edges`, yielding edges in bounded-size numpy chunks.
+
+    Arguments
+    ---------
+        df {pd.DataFrame} -- dataframe of ews dataset
+        cols {list} -- column names of attributes to be checked
+    Keyword Arguments
+    -----------------
+        directed {bool} -- True to create directed graph, False to create undirected graph
+        chunksize {int} -- maximum number of edges per chunk
+        max_group_size {int} -- groups of equal values larger than this follow the `oversize` policy,
+            None to connect every group as a clique
+        oversize {str} -- 'skip' drops oversize groups, 'sample' connects `max_group_size` random rows
+            of them, 'star' connects every row of them to the first row of the group
+        random_state {int} -- seed used by the 'sample' policy
+    Yield
+    -----
+        (col, source, target) {(str, np.ndarray, np.ndarray)} -- index labels of the edges in `col`
+    Example
+    -------
+        >>> for col, source, target in iter_tuple_edges(df, ['phone', 'email'], max_group_size=1000):
+        ...     graph.add_edges_from(zip(source, target))
+    """
+    seed = np.random.SeedSequence(random_state).entropy
+    for i, (src, dst) in _iter_edge_chunks(df, cols, directed=directed, max_group_size=max_group_size,
+                                           oversize=oversize, seed=seed, chunksize=chunksize):
+        yield cols[i], df.index.take(src).to_numpy(), df.index.take(dst).to_numpy()
+
+
+def write_tuple_edges(df, cols, filename, file_format=None, directed=False, chunksize=1000000,
+                      max_group_size=None, oversize='skip', random_state=None):
+    """
+    Write the edges of `iter_tuple_edges` to a csv or parquet file, one chunk at a time.
+
+    Arguments
+    ---------
+        df {pd.DataFrame} -- dataframe of ews dataset
+        cols {list} -- column names of attributes to be checked
+        filename {str} -- output file, with columns `attribute`, `source` and `target`
+    Keyword Arguments
+    -----------------
+        file_format {str} -- 'csv' or 'parquet', inferred from `filename` extension if None
+        directed, chunksize, max_group_size, oversize, random_state -- see `iter_tuple_edges`
+    Return
+    ------
+        n {int} -- number of edges written
+    Writing parquet requires pyarrow.
+    """
+    file_format = file_format or ('parquet' if filename.endswith('.parquet') else 'csv')
+    if file_format not in ['csv', 'parquet']:
+        raise ValueError("Unknown file format. Supported formats are ['csv', 'parquet'].")
+
+    def to_frame(col, source, target):
+        return pd.DataFrame({'attribute': col, 'source': source, 'target': target})
+
+    edges = iter_tuple_edges(df, cols, directed=directed, chunksize=chunksize,
+                             max_group_size=max_group_size, oversize=oversize, random_state=random_state)
+    empty = to_frame(pd.Series([], dtype='str'), df.index[:0], df.index[:0])
+    n = 0
+    if file_format == 'csv':
+        with open(filename, 'w', encoding="utf-8", newline='') as f:
+            empty.to_csv(f, index=False)
+            for chunk in edges:
+                to_frame(*chunk).to_csv(f, header=False, index=False)
+                n += len(chunk[1])
+    else:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = None
+        try:
+            for chunk in edges:
+                table = pa.Table.from_pandas(
+                    to_frame(*chunk), schema=writer.schema if writer else None, preserve_index=False
+                )
+                writer = writer or pq.ParquetWriter(filename, table.schema)
+                writer.write_table(table)
+                n += len(chunk[1])
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is None:
+            pq.write_table(pa.Table.from_pandas(empty, preserve_index=False), filename)
+    return n
+
+
+def get_adjacency_matrix(df, cols, weight=True, fmt='csr', exclude_xna=True):
+    """
+    Arguments
+    ---------
+        df {pd.DataFrame} -- dataframe of ews dataset
+        cols {list} -- column names of attributes to be checked
+    Keyword Arguments
+    -----------------
+        weight {bool} -- True to sum all attributes into one matrix, the value of an entry being the
+            number of attributes shared by the two rows. False to return one 0/1 matrix per attribute
+        fmt {str} -- scipy.sparse format of the result, e.g 'csr' or 'coo'
+        exclude_xna {bool} -- False to treat the 'XNA' placeholder as a regular value
+    Return
+    ------
+        A {scipy.sparse.spmatrix} -- symmetric (n x n) adjacency matrix over row positions of df,
+            or dictionary with key of cols, and value of adjacency matrix if weight is False
+    The matrix is computed as B @ B.T from the row-to-value incidence matrix B, so no edge tuple is
+    ever created. Degrees are A.getnnz(axis=1), neighbours of row i are A[i].indices, and
+    scipy.sparse.csgraph.connected_components(A) gives the clusters.
+    """
+    n = df.shape[0]
+    d = {col: _column_adjacency(_factorize(df[col], exclude_xna=exclude_xna)) for col in cols}
+
+    if weight is True:
+        total = sum(d.values(), sp.csr_matrix((n, n), dtype=np.int64))
+        return total.asformat(fmt)
+    return {col: adjacency.asformat(fmt) for col, adjacency in d.items()}
+
+
+def _star_edges(positions, offsets):
+    """
+    Edges linking every row of a value group to the first row of the group. They connect the
+    same rows as the clique of the group, with one edge per row instead of one per pair.
+    """
+    firsts = np.repeat(positions[offsets[:-1]], np.diff(offsets))
+    keep = positions != firsts
+    return firsts[keep], positions[keep]
+
+
+def get_components(df, cols, exclude_xna=True, max_group_size=None, name='cluster'):
+    """
+    Cluster rows that are connected through shared attribute values, without building edges.
+
+    Arguments
+    ---------
+        df {pd.DataFrame} -- dataframe of ews dataset
+        cols {list} -- column names of attributes to be checked
+    Keyword Arguments
+    -----------------
+        exclude_xna {bool} -- False to treat the 'XNA' placeholder as a regular value
+        max_group_size {int} -- values shared by more rows than this, e.g. a dummy phone number,
+            do not link rows, None to use every value
+        name {str} -- name of the result
+    Return
+    ------
+        clusters {pd.Series} -- cluster id of every row, aligned to df.index. Two rows have the same
+            id if a chain of shared values links them, rows sharing nothing have their own id
+    Every value group is linked as a star on its first row, so the graph has less than
+    len(cols) * n edges however many pairs the groups imply, and scipy connected_components on it
+    gives the same clusters as on the full edge list.
+    """
+    n = df.shape[0]
+    src, dst = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+    for col in cols:
+        positions, offsets = _value_groups(_factorize(df[col], exclude_xna=exclude_xna))
+        if max_group_size is not None:
+            positions, offsets, _, _ = _limit_groups(positions, offsets, max_group_size, oversize='skip')
+        s, t = _star_edges(positions, offsets)
+        src.append(s)
+        dst.append(t)
+    src, dst = np.concatenate(src), np.concatenate(dst)
+    graph = sp.csr_matrix((np.ones(len(src), dtype=np.int8), (src, dst)), shape=(n, n))
+    _, labels = csgraph.connected_components(graph, directed=False)
+    return pd.Series(labels, index=df.index, name=name)
+
+
+def _value_hashes(series, exclude_xna=True):
+    """
+    uint64 hash of every value that creates edges, and the mask of those values. Numbers are hashed
+    as float64, so a column read as int one day and as float the next keeps the same keys.
+    """
+    valid = ~_null_mask(series, exclude_xna=exclude_xna)
+    if pd.api.types.is_numeric_dtype(series):
+        values = series.to_numpy(dtype=np.float64, na_value=np.nan)[valid] + 0.  # -0.0 as 0.0
+    else:
+        values = series.to_numpy()[valid]
+    return pd.util.hash_array(values), valid
+
+
+def _load_array(filename):
+    """Memory-map a .npy file, or load it if it holds python objects, e.g. string labels."""
+    try:
+        return np.load(filename, mmap_mode='r')
+    except ValueError:
+        return np.load(filename, allow_pickle=True)
+
+
+def _expand_groups(rows, offsets, groups):
+    """Rows of every group in `groups`, concatenated, and the number of rows of each group."""
+    starts, sizes = offsets[groups], offsets[groups + 1] - offsets[groups]
+    flat = np.repeat(starts - np.cumsum(sizes) + sizes, sizes) + np.arange(sizes.sum(), dtype=np.int64)
+    return np.asarray(rows[flat], dtype=np.int64), sizes
+
+
+def _find_roots(parents, x):
+    """Root of every node of `x` in a union-find forest, by pointer jumping."""
+    roots = np.asarray(parents[x], dtype=np.int64)
+    while True:
+        up = np.asarray(parents[roots], dtype=np.int64)
+        if np.array_equal(up, roots):
+            return roots
+        roots = up
+
+
+class EdgeIndex:
+    """
+    Persistent value to rows index of some attributes, to get the edges of appended rows only.
+
+    The index is a directory of segments, one per call of `update`. A segment stores, for every
+    column, the sorted hashes of its values, the CSR offsets of the value groups and the row
+    positions of every group as .npy files, memory-mapped when the index is opened. A union-find
+    forest of the rows, `parents.int64`, is grown in place and gives the connected components.
+    Rows are numbered by position in the order they were added.
+
+    The cost of `update` is a binary search of the new values in every segment plus the number
+    of edges produced, it does not depend on the number of rows already indexed. Call `compact`
+    from time to time to merge the segments into one.
+
+    Arguments
+    ---------
+        path {str} -- directory of the index, created if needed
+    Keyword Arguments
+    -----------------
+        cols {list} -- column names of attributes to be indexed, required to create the index
+        exclude_xna {bool} -- False to treat the 'XNA' placeholder as a regular value
+        max_group_size {int} -- values shared by more rows than this, old and new together, create
+            no edge and link no component, None to use every value. Edges and links made before
+            a value grew past it are kept
+    Values are identified by a 64 bits hash, and a column must keep the same kind of values,
+    numbers or strings, from one update to the next.
+    Example
+    -------
+        >>> index = EdgeIndex('contracts_index', cols=['phone', 'email'])
+        >>> index.update(history, edges=False)
+        >>> res = index.update(new_contracts)  # every night
+        >>> res['connection']  # edges of the new contracts, with the number of attributes shared
+    """
+
+    def __init__(self, path, cols=None, exclude_xna=True, max_group_size=None):
+        self.path = path
+        meta_file = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_file):
+            with open(meta_file) as f:
+                self.meta = json.load(f)
+            if cols is not None and list(cols) != self.meta['cols']:
+                raise ValueError("Index of {} is for columns {}, not {}.".format(path, self.meta['cols'], list(cols)))
+        else:
+            if cols is None:
+                raise ValueError("No index in {}, cols are required to create one.".format(path))
+            os.makedirs(path, exist_ok=True)
+            self.meta = {'cols': list(cols), 'exclude_xna': exclude_xna, 'max_group_size': max_group_size,
+                         'n_rows': 0, 'segments': [], 'next_segment': 0}
+            self._write_meta()
+        with open(self._parents_file, 'ab') as f:
+            f.truncate(self.n_rows * 8)  # drops the rows of an update interrupted before its end
+        self._open_segments()
+
+    def __repr__(self):
+        return "EdgeIndex(path={!r}, cols={}, n_rows={}, segments={})".format(
+            self.path, self.cols, self.n_rows, len(self.meta['segments'])
+        )
+
+    @property
+    def cols(self):
+        return self.meta['cols']
+
+    @property
+    def n_rows(self):
+        return self.meta['n_rows']
+
+    @property
+    def _parents_file(self):
+        return os.path.join(self.path, 'parents.int64')
+
+    def _write_meta(self):
+        filename = os.path.join(self.path, 'meta.json')
+        with open(filename + '.tmp', 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(filename + '.tmp', filename)
+
+    def _open_segments(self):
+        self.segments = []
+        for name, start in self.meta['segments']:
+            folder = os.path.join(self.path, name)
+            columns = [tuple(_load_array(os.path.join(folder, '{}_{}.npy'.format(i, x)))
+                             for x in ['keys', 'offsets', 'rows']) for i in range(len(self.cols))]
+            self.segments.append((start, _load_array(os.path.join(folder, 'labels.npy')), columns))
+        self.parents = self._open_parents()
+
+    def _open_parents(self):
+        if self.n_rows == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.memmap(self._parents_file, dtype=np.int64, mode='r+', shape=(self.n_rows,))
+
+    def _write_segment(self, name, labels, columns):
+        folder = os.path.join(self.path, name)
+        shutil.rmtree(folder, ignore_errors=True)
+        os.makedirs(folder)
+        np.save(os.path.join(folder, 'labels.npy'), np.asarray(labels))
+        for i, column in enumerate(columns):
+            for x, array in zip(['keys', 'offsets', 'rows'], column):
+                np.save(os.path.join(folder, '{}_{}.npy'.format(i, x)), array)
+
+    def labels(self, positions):
+        """Index labels of the rows at `positions`."""
+        positions = np.asarray(positions, dtype=np.int64)
+        res = np.empty(len(positions), dtype=object)
+        starts = np.array([start for start, _, _ in self.segments], dtype=np.int64)
+        segment = np.searchsorted(starts, positions, side='right') - 1
+        for s in np.unique(segment):
+            mask = segment == s
+            start, labels, _ = self.segments[s]
+            res[mask] = labels[positions[mask] - start]
+        return pd.Index(res).infer_objects()
+
+    def _column_delta(self, i, hashes, rows, n):
+        """
+        Old rows matching the new values of column i.
+
+        Return
+        ------
+            old_src, new_dst {np.ndarray} -- (old row, new row) pairs sharing a value
+            old_size {np.ndarray} -- number of old rows sharing the value of every new row
+            rep {np.ndarray} -- an old row sharing the value of every new row, -1 if none
+        """
+        old_src, new_dst = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+        old_size = np.zeros(len(hashes), dtype=np.int64)
+        rep = np.full(len(hashes), -1, dtype=np.int64)
+        for _, _, columns in self.segments:
+            keys, offsets, seg_rows = columns[i]
+            if len(keys) == 0:
+                continue
+            idx = np.minimum(np.searchsorted(keys, hashes), len(keys) - 1)
+            found = np.flatnonzero(np.asarray(keys[idx]) == hashes)
+            src, sizes = _expand_groups(seg_rows, offsets, idx[found])
+            old_src.append(src)
+            new_dst.append(np.repeat(rows[found], sizes))
+            old_size[found] += sizes
+            rep[found] = np.where(rep[found] < 0, seg_rows[offsets[idx[found]]], rep[found])
+        return np.concatenate(old_src), np.concatenate(new_dst), old_size, rep
+
+    def update(self, df, edges=True, weight=True, directed=False):
+        """
+        Add rows to the index, and get their edges and components.
+
+        Arguments
+        ---------
+            df {pd.DataFrame} -- new rows, with the indexed columns
+        Keyword Arguments
+        -----------------
+            edges {bool} -- False to only index the rows, e.g. for the first load of the history
+            weight {bool} -- True to combine all attributes as weight of edges, see `get_tuple_edges`
+            directed {bool} -- True to also give every edge as (new row, old row)
+        Return
+        ------
+            d {dict} -- edges involving at least one new row, in the format of `get_tuple_edges`,
+                d['components'] the component id of every new row, indexed by its label, and
+                d['merged'] the new id of every old component joined by the new rows. A component
+                id is the position of one of its rows
+        Edges of two old rows do not change, so the weights of the new edges are the only weights
+        updated.
+        """
+        cols, n, m = self.cols, self.n_rows, df.shape[0]
+        max_group_size = self.meta['max_group_size']
+        new_rows = np.arange(n, n + m, dtype=np.int64)
+        chunks, columns = [], []
+        link_src, link_dst = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+        for i, col in enumerate(cols):
+            hashes, valid = _value_hashes(df[col], exclude_xna=self.meta['exclude_xna'])
+            rows = new_rows[valid]
+            order = np.argsort(hashes, kind='stable')
+            keys, inverse, counts = np.unique(hashes[order], return_inverse=True, return_counts=True)
+            offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+            columns.append((keys, offsets, rows[order]))
+            codes = np.empty(len(hashes), dtype=np.int64)
+            codes[order] = inverse
+
+            old_src, new_dst, old_size, rep = self._column_delta(i, hashes, rows, n)
+            usable = np.ones(len(hashes), dtype=bool)
+            if max_group_size is not None:
+                usable = old_size + counts[codes] <= max_group_size
+                keep = np.isin(new_dst, rows[usable])
+                old_src, new_dst = old_src[keep], new_dst[keep]
+
+            # Every new row is linked to one old row of its value, or else to the first new row of it
+            rep = np.where(rep >= 0, rep, rows[order][offsets[:-1]][codes])
+            link_src.append(rep[usable])
+            link_dst.append(rows[usable])
+
+            if edges is True:
+                graph = _column_graph(np.where(usable, codes, -1))
+                src, dst = _edge_range(graph, 0, _n_edges(graph))
+                src = np.concatenate([old_src, rows[src]])
+                dst = np.concatenate([new_dst, rows[dst]])
+                if directed is True:
+                    src, dst = np.concatenate([src, dst]), np.concatenate([dst, src])
+                chunks.append((src, dst))
+
+        name = 'seg{:05d}'.format(self.meta['next_segment'])
+        self._write_segment(name, df.index.to_numpy(), columns)
+        with open(self._parents_file, 'ab') as f:
+            f.write(new_rows.tobytes())
+        merged = self._union(np.concatenate(link_src), np.concatenate(link_dst), n + m)
+
+        self.meta['n_rows'] = n + m
+        self.meta['segments'].append([name, n])
+        self.meta['next_segment'] += 1
+        self._write_meta()
+        self._open_segments()
+
+        d = {}
+        if edges is True:
+            if weight is True:
+                keys = np.concatenate([np.empty(0, dtype=np.int64)] + [src * (n + m) + dst for src, dst in chunks])
+                keys, counts = np.unique(keys, return_counts=True)
+                d['connection'] = pd.DataFrame({
+                    'source': self.labels(keys // (n + m)), 'target': self.labels(keys % (n + m)), 'weight': counts,
+                })
+            else:
+                for col, (src, dst) in zip(cols, chunks):
+                    d[col] = list(zip(self.labels(src).tolist(), self.labels(dst).tolist()))
+        d['components'] = pd.Series(_find_roots(self.parents, new_rows), index=df.index, name='component')
+        d['merged'] = merged
+        return d
+
+    def _union(self, src, dst, n_rows):
+        """
+        Join the components of every (src, dst) pair in the parents file.
+
+        Only the roots of the old rows involved and the new rows are touched: their components are
+        found with scipy on that small graph, and every node points to the smallest root of its
+        component, so an old root never points to a new row.
+        """
+        parents = np.memmap(self._parents_file, dtype=np.int64, mode='r+', shape=(n_rows,))
+        if len(src) == 0:
+            return pd.Series([], index=pd.Index([], dtype=np.int64, name='component'), dtype=np.int64,
+                             name='merged_into')
+        src, dst = _find_roots(parents, src), _find_roots(parents, dst)
+        nodes, inverse = np.unique(np.concatenate([src, dst]), return_inverse=True)
+        graph = sp.csr_matrix((np.ones(len(src), dtype=np.int8), (inverse[:len(src)], inverse[len(src):])),
+                              shape=(len(nodes), len(nodes)))
+        _, labels = csgraph.connected_components(graph, directed=False)
+        roots = np.full(labels.max() + 1 if len(labels) else 0, n_rows, dtype=np.int64)
+        np.minimum.at(roots, labels, nodes)
+        new_parents = roots[labels]
+        old = (nodes < self.n_rows) & (new_parents != nodes)
+        parents[nodes] = new_parents
+        parents.flush()
+        return pd.Series(new_parents[old], index=pd.Index(nodes[old], name='component'), name='merged_into')
+
+    def components(self, name='component'):
+        """Component id of every row, indexed by label, the parents being compressed on the way."""
+        roots = _find_roots(self.parents, np.arange(self.n_rows, dtype=np.int64))
+        if self.n_rows:
+            self.parents[:] = roots
+            self.parents.flush()
+        return pd.Series(roots, index=self.labels(np.arange(self.n_rows)), name=name)
+
+    def compact(self):
+        """Merge every segment into one, so an update searches a single segment again."""
+        if len(self.segments) <= 1:
+            return
+        columns = []
+        for i in range(len(self.cols)):
+            keys = np.concatenate([np.repeat(c[i][0], np.diff(c[i][1])) for _, _, c in self.segments])
+            rows = np.concatenate([np.asarray(c[i][2]) for _, _, c in self.segments])
+            order = np.lexsort((rows, keys))
+            keys, counts = np.unique(keys[order], return_counts=True)
+            columns.append((keys, np.concatenate([[0], np.cumsum(counts)]).astype(np.int64), rows[order]))
+        labels = np.concatenate([np.asarray(labels) for _, labels, _ in self.segments])
+
+        old = [name for name, _ in self.meta['segments']]
+        name = 'seg{:05d}'.format(self.meta['next_segment'])
+        self._write_segment(name, labels, columns)
+        self.segments = []
+        self.meta['segments'] = [[name, 0]]
+        self.meta['next_segment'] += 1
+        self._write_meta()
+        for folder in old:
+            shutil.rmtree(os.path.join(self.path, folder), ignore_errors=True)
+        self._open_segments()
@@ -1,9 +1,11 @@
 import math
 import numpy as np
+import pandas as pd
 import matplotlib.pyplot as plt
+from matplotlib.collections import PolyCollection
 import seaborn as sns
-import statsmodels.api as sm
-from .utils import autolabel
+from .profiling import ColumnProfile, Profile, profile_frame, _bin_edges, _ecdf_points, _top_counts
+from .utils import autolabel, bulk_text
 
 
 def grid_plots(ncols, nrows, n=None, figsize=None):
@@ -20,22 +22,50 @@ def grid_plots(ncols, nrows, n=None, figsize=None):
     return fig, axes
 
 
-def plot_ecdf_numerical(series, ax, **kwargs):
-    ecdf = sm.distributions.ECDF(series)
-    ax.plot(ecdf.x, ecdf.y, **kwargs)
+def plot_ecdf_numerical(series, ax, n_points=1000, max_error=None, **kwargs):
+    """
+    Plot the ECDF of series through at most n_points points at evenly spaced ranks, so the
+    figure does not grow with the number of rows. max_error, if given, is the largest vertical
+    distance allowed to the full ECDF and sets n_points to 1 / max_error + 1.
+    """
+    if isinstance(series, ColumnProfile):
+        ax.plot(*series.ecdf, **kwargs)
+        return ax
+    if max_error is not None:
+        n_points = int(np.ceil(1 / max_error)) + 1
+    values = np.sort(np.asarray(series, dtype=np.float64))
+    values = values[~np.isnan(values)]
+    ax.plot(*_ecdf_points(values, n_points), **kwargs)
     return ax
 
 
-def plot_pdf_numerical(series, **kwargs):
-    return sns.histplot(series, **kwargs)
+def plot_pdf_numerical(series, bins='auto', max_bins=100, **kwargs):
+    """
+    Histogram of series counted with np.histogram, seaborn then only draws the bins. Bins are
+    capped to max_bins, so render time and figure size do not grow with the number of rows.
+    """
+    if isinstance(series, ColumnProfile):
+        ax = kwargs.pop('ax', None) or plt.gca()
+        kwargs.setdefault('alpha', 0.75)
+        ax.stairs(*series.hist, fill=True, **kwargs)
+        ax.set_ylabel('Count')
+        return ax
+    values = np.asarray(series, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    counts, edges = np.histogram(values, bins=_bin_edges(values, bins=bins, max_bins=max_bins))
+    ax = sns.histplot(x=edges[:-1], weights=counts, bins=list(edges), **kwargs)
+    if getattr(series, 'name', None) is not None:
+        ax.set_xlabel(series.name)
+    return ax
 
 
 def distribution_gridplots(data, cols_num, hue=None, ncols=3, axes=None, figsize=None, type='pdf'):
     """
     Parameters
     ----------
-    data : pandas.DataFrame
+    data : pandas.DataFrame or edapy.profiling.Profile
         dataframe without infinite values. will drop null values while plotting.
+        a profile from `profile_frame`, split by hue if hue is given, is plotted without rescanning
     cols_num : List[str]
         interval or ratio column in data
     hue : str, default=None
@@ -61,16 +91,22 @@ def distribution_gridplots(data, cols_num, hue=None, ncols=3, axes=None, figsize
         fig, axes = grid_plots(nrows, ncols, n=n, figsize=figsize)
     sorted_cols_num = sorted(cols_num)  # we want it sorted for easier search
 
+    if isinstance(data, Profile):
+        data.check_hue(hue)
+    elif hue is not None:
+        # Split every column by hue in one pass instead of masking the frame per column and hue
+        data = profile_frame(data, cols_num=cols_num, cols_cat=[], hue=hue)
+
     if hue is None:
         for col, ax in zip(sorted_cols_num, axes):
             ax = map_plot_type(type, data[col], ax=ax)
             ax.set_xlabel(col)
     else:
-        sorted_cols_target = sorted(data[hue].unique())
+        sorted_cols_target = data.hue_values
         colors = list(plt.cm.tab10(np.arange(len(sorted_cols_target))))
         for col, ax in zip(sorted_cols_num, axes):
             for t, color in zip(sorted_cols_target, colors):
-                ax = map_plot_type(type, data[data[hue] == t][col].dropna(), ax=ax, color=color)
+                ax = map_plot_type(type, data[col].by_hue[t], ax=ax, color=color)
             ax.set_xlabel(col)
             ax.legend(sorted_cols_target)
     return fig, axes
@@ -98,15 +134,92 @@ def pdf_numerical(data, cols_num, hue=None, ncols=3, axes=None, figsize=None):
     )
 
 
+def _top_k_value_counts(data, col, top_k, by=None, normalize=False, dropna=True, other='other'):
+    """
+    Counts of the `top_k` most frequent values of a column, by decreasing count, and the exact
+    count of every other value summed into an `other` entry.
+
+    Values are counted once with a bincount and the top ones found with a partial selection, no
+    full sort. With `by`, the top values are chosen on the whole column and counted per group.
+    """
+    if isinstance(data, Profile):
+        counts = data[col].value_counts(dropna=dropna)
+        top = counts.iloc[_top_counts(counts.to_numpy(), top_k)]
+        groups = data[col].by_hue.items() if by is not None else [(None, data[col])]
+        rows = {}
+        for t, p in groups:
+            kept = p.value_counts(dropna=dropna).reindex(top.index, fill_value=0)
+            total = p.count + (0 if dropna else p.nulls)
+            rows[t] = pd.concat([kept, pd.Series([total - kept.sum()], index=[other])])
+        res = pd.DataFrame(rows).T
+    else:
+        codes, uniques = pd.factorize(data[col], use_na_sentinel=dropna)
+        valid = codes >= 0
+        top = _top_counts(np.bincount(codes[valid], minlength=len(uniques)), top_k)
+
+        # Codes of the top values become 0..k-1, every other value becomes k
+        remap = np.full(len(uniques), len(top))
+        remap[top] = np.arange(len(top))
+        if by is None:
+            by_codes, by_values = np.zeros(len(codes), dtype=np.int64), [None]
+        else:
+            by_codes, by_values = pd.factorize(data[by], sort=True)
+        valid &= by_codes >= 0
+        n = len(top) + 1
+        counts = np.bincount(by_codes[valid] * n + remap[codes[valid]], minlength=len(by_values) * n)
+        res = pd.DataFrame(counts.reshape(len(by_values), n), index=by_values,
+                           columns=list(uniques.take(top)) + [other])
+
+    if not res[other].any():
+        res = res.drop(columns=other)
+    if normalize:
+        res = res.div(res.sum(axis=1), axis=0)
+    if by is None:
+        return res.iloc[0].rename(col)
+    res.index.name, res.columns.name = by, col
+    return res.where(res > 0)
+
+
+def _value_counts(data, col, by=None, normalize=False, sort=False, dropna=True, top_k=None):
+    """
+    value_counts of a column of a dataframe or of a profile, one row per `by` value if given.
+
+    Without `by`, a Series like `data[col].value_counts`. With `by`, a DataFrame like
+    `data.groupby(by)[col].value_counts().unstack()`, indexed by `by` values. With `top_k`, see
+    `_top_k_value_counts`.
+    """
+    if top_k is not None:
+        return _top_k_value_counts(data, col, top_k, by=by, normalize=normalize, dropna=dropna)
+    if not isinstance(data, Profile):
+        if by is None:
+            return data[col].value_counts(normalize=normalize, sort=sort, dropna=dropna)
+        return data.groupby(by)[col].value_counts(normalize=normalize, sort=sort, dropna=dropna).unstack()
+
+    if by is None:
+        res = data[col].value_counts(normalize=normalize, dropna=dropna)
+        return res.sort_values(ascending=False, kind='stable') if sort else res
+    res = pd.DataFrame({t: p.value_counts(normalize=normalize, dropna=dropna)
+                        for t, p in data[col].by_hue.items()}).T
+    res.index.name, res.columns.name = by, col
+    # Like unstack, values absent from every group are dropped and missing pairs are NaN
+    res = res.loc[:, (res > 0).any()]
+    try:
+        res = res.sort_index(axis=1)
+    except TypeError:
+        pass
+    return res.where(res > 0)
+
+
 def distplot_categorical(data, cols_cat, col_target=None, normalize=True, ncols=3,
-                         sort=False, kind='bar', axes=None, figsize=None):
+                         sort=False, kind='bar', axes=None, figsize=None, top_k=None):
     """
     Distplot categorical column attributes in small multiple grid.
 
     Parameters
     ----------
-    data : pandas.DataFrame
+    data : pandas.DataFrame or edapy.profiling.Profile
         dataframe without infinite values. will drop null values while plotting.
+        a profile from `profile_frame`, split by col_target if given, is plotted without rescanning
     cols_cat : list of str
         categorical column in data
     col_target : str, optional
@@ -124,40 +237,57 @@ def distplot_categorical(data, cols_cat, col_target=None, normalize=True, ncols=
         category dtype
     kind : str, default='bar'
         matplotlib plot kind, really recommend to do bar plot, alternative would be 'barh'
+    top_k : int, default=None
+        only plot the top_k most frequent values and an 'other' bar with the rest, by decreasing count
     """
     if axes is None:
         n = len(cols_cat)
         nrows = math.ceil(n / ncols)
         fig, axes = grid_plots(nrows, ncols, n=n, figsize=figsize)
     sorted_cols_cat = sorted(cols_cat)  # we want it sorted for easier search
+    if isinstance(data, Profile):
+        data.check_hue(col_target)
 
     if col_target is None:
         for col, ax in zip(sorted_cols_cat, axes):
-            data[col].value_counts(normalize=normalize, sort=sort).plot(ax=ax, kind=kind)
+            _value_counts(data, col, normalize=normalize, sort=sort, top_k=top_k).plot(ax=ax, kind=kind)
             xlabels = [x.get_text()[:15]+'...' if (len(x.get_text()) > 15) else x for x in ax.get_xticklabels()]
             ax.set_xticklabels(xlabels, rotation=30, ha='right')
             ax.set_xlabel(col)
     else:
         for col, ax in zip(sorted_cols_cat, axes):
-            data.groupby(col_target)[col].value_counts(normalize=normalize, sort=sort).unstack(0).plot(ax=ax, kind=kind)
+            counts = _value_counts(data, col, by=col_target, normalize=normalize, sort=sort, top_k=top_k)
+            counts.T.plot(ax=ax, kind=kind)
             xlabels = [x.get_text()[:15]+'...' if (len(x.get_text()) > 15) else x for x in ax.get_xticklabels()]
             ax.set_xticklabels(xlabels, rotation=30, ha='right')
     plt.tight_layout()
     return fig, axes
 
 
+def _barh_collection(ax, widths, height=0.8, **kwargs):
+    """Horizontal bars centered on 0..n-1 drawn as one PolyCollection instead of n patches."""
+    y = np.arange(len(widths))
+    x0, y0, y1 = np.zeros(len(widths)), y - height / 2, y + height / 2
+    verts = np.stack([np.column_stack(c) for c in [(x0, y0), (widths, y0), (widths, y1), (x0, y1)]], axis=1)
+    bars = PolyCollection(verts, **kwargs)
+    bars.sticky_edges.x.append(0)
+    ax.add_collection(bars)
+    ax.autoscale_view()
+    return bars
+
+
 def distplot_categorical_pretty(
     data, cols_cat, normalize=True,
     axes=None, figsize=None, ncols=5,
     sort=False, text_format="{:.2f}", alignment='right',
-    color="#62AF8F", lbl_limit=12, filename='',
+    color="#62AF8F", lbl_limit=12, filename='', max_labels=None, top_k=None,
 ):
     """
     Plot binned numerical or categorical column vertically with text percentage shown.
 
     Parameters
     ----------
-    data : pandas.DataFrame
+    data : pandas.DataFrame or edapy.profiling.Profile
         dataframe without infinite values, will drop null values while plotting
     cols_cat : list of str
         categorical column in data
@@ -180,6 +310,10 @@ def distplot_categorical_pretty(
         hex format string of bar color
     lbl_limit : int, default=12
         label limit, will truncate longer label
+    max_labels : int, default=None
+        only label the max_labels largest bars, all bars if None
+    top_k : int, default=None
+        only plot the top_k most frequent values and an 'other' bar with the rest, by decreasing count
     """
     if axes is None:
         n = len(cols_cat)
@@ -187,29 +321,28 @@ def distplot_categorical_pretty(
         fig, axes = grid_plots(nrows, ncols, n=n, figsize=figsize)
 
     for col, ax in zip(sorted(cols_cat), axes):
-        plot_data = data[col].value_counts(normalize=normalize, sort=sort, dropna=False)
-        bars = ax.barh(plot_data.index, plot_data.values, align='center', height=0.8, alpha=0.7, color=color)
+        plot_data = _value_counts(data, col, normalize=normalize, sort=sort, dropna=False, top_k=top_k)
+        widths = plot_data.values
+        _barh_collection(ax, widths, height=0.8, alpha=0.7, color=color)
 
         max_x_value = ax.get_xlim()[1]
         distance = max_x_value * 0.01
 
-        ticks_loc = ax.get_yticks()
-        ax.set_yticks(ticks_loc)
-        yticklabels = [x[:lbl_limit]+'...' if (len(x) > lbl_limit) else x for x in plot_data.index]
+        # Only the max_labels largest bars get a tick label and a text label
+        labeled = np.arange(len(widths))
+        if max_labels is not None and len(widths) > max_labels:
+            labeled = np.sort(np.argpartition(-widths, max_labels - 1)[:max_labels])
+        ax.set_yticks(labeled)
+        yticklabels = [str(x) for x in plot_data.index[labeled]]
+        yticklabels = [x[:lbl_limit]+'...' if (len(x) > lbl_limit) else x for x in yticklabels]
         ax.set_yticklabels(yticklabels)
 
+        # Bars are centered on 0..n-1, all labels are drawn by a single artist
+        texts = [text_format.format(width) for width in widths[labeled]]
         if alignment == 'default':
-            for bar in bars:
-                text = text_format.format(bar.get_width())
-                text_x = bar.get_width() + distance
-                text_y = bar.get_y() + bar.get_height() / 2
-                ax.text(text_x, text_y, text, va='center')
+            bulk_text(ax, widths[labeled] + distance, labeled, texts, va='center')
         elif alignment == 'right':
-            for bar in bars:
-                text = text_format.format(bar.get_width())
-                text_x = max_x_value
-                text_y = bar.get_y() + bar.get_height() / 2
-                ax.text(text_x, text_y, text, va='center')
+            bulk_text(ax, np.full(len(labeled), max_x_value), labeled, texts, va='center')
 
         ax.spines['top'].set_visible(False)
         ax.spines['right'].set_visible(False)
@@ -221,11 +354,21 @@ def distplot_categorical_pretty(
     return fig, axes
 
 
-def plot_share(data, col_x, col_y, legend=None, figsize=(16, 4), stacked=True, dropna=False, color=None, reindex=None):
+def plot_share(data, col_x, col_y, legend=None, figsize=(16, 4), stacked=True, dropna=False, color=None, reindex=None,
+               show=True, top_k=None):
+    """
+    Count and share of col_y values within every col_x value, as bar plots side by side.
+
+    data can be an edapy.profiling.Profile split by col_x instead of a dataframe. show=False
+    returns the figure without calling plt.show(). top_k only keeps the top_k most frequent col_y
+    values and stacks the rest as 'other'.
+    """
     fig, axes = plt.subplots(1, 2, figsize=figsize)
-    data.groupby(col_x)[col_y].value_counts(normalize=False, dropna=dropna).unstack()\
+    if isinstance(data, Profile):
+        data.check_hue(col_x)
+    _value_counts(data, col_y, by=col_x, normalize=False, dropna=dropna, top_k=top_k)\
         .reindex(reindex).plot(kind='bar', alpha=0.7, stacked=stacked, ax=axes[0], color=color)
-    data.groupby(col_x)[col_y].value_counts(normalize=True, dropna=dropna).unstack()\
+    _value_counts(data, col_y, by=col_x, normalize=True, dropna=dropna, top_k=top_k)\
         .reindex(reindex).plot(kind='bar', alpha=0.7, stacked=stacked, ax=axes[1], color=color)
 
     for ax, norm in zip(axes, [False, True]):
@@ -243,23 +386,27 @@ def plot_share(data, col_x, col_y, legend=None, figsize=(16, 4), stacked=True, d
             label.set_rotation(45)
 
         autolabel(ax, normalized=norm)
-    plt.show()
+    if show:
+        plt.show()
+    return fig, axes
 
 
-def waffle_chart(df_pivot, suptitle='', title='', figsize=(14, 2.8)):
+def waffle_chart(df_pivot, suptitle='', title='', figsize=(14, 2.8), show=True):
     """
     Create waffle chart like the one in github contribution.
 
     Parameters
     ----------
     df_pivot : pandas.DataFrame
-        pivot dataframe with 3 columns (x, y, values)
+        pivot dataframe, output of edapy.transformation.create_pivot or calendar_pivot, sparse or not
     suptitle : str, default=''
         title string in the plot
     title : str, default = ''
         subtitle string in the plot
     figsize : (float, float), default=(14, 2.8)
         figisze arguments of plt.subplots()
+    show : bool, default=True
+        if False, return the figure without calling plt.show()
     """
     Weekday, Week = np.mgrid[:df_pivot.shape[0]+1, :df_pivot.shape[1]+1]
     fig, ax = plt.subplots(figsize=figsize)
@@ -272,9 +419,12 @@ def waffle_chart(df_pivot, suptitle='', title='', figsize=(14, 2.8)):
     ax.set_xticklabels(list(df_pivot.columns))
     ax.set_xlabel(df_pivot.columns.name)
 
-    plt.pcolormesh(Week, Weekday, df_pivot.values, cmap="Blues", edgecolor="w")
+    values = df_pivot.sparse.to_dense().values if hasattr(df_pivot, 'sparse') else df_pivot.values
+    plt.pcolormesh(Week, Weekday, values, cmap="Blues", edgecolor="w")
     plt.xlim(0, df_pivot.shape[1])
     plt.suptitle(suptitle, fontsize=20, ha='left', x=0.125)
     plt.title(title, fontsize=14, loc='left')
     plt.colorbar()
-    plt.show()
+    if show:
+        plt.show()
+    return fig, ax
@@ -0,0 +1,262 @@
+import numpy as np
+import pandas as pd
+
+
+class ColumnProfile:
+    """
+    Summary of one column computed by `profile_frame`, enough to draw it without the raw data.
+
+    Attributes
+    ----------
+        name {str} -- column name
+        kind {str} -- 'numerical' or 'categorical'
+        count {int} -- number of non-null values
+        nulls {int} -- number of null values
+        nunique {int} -- number of distinct non-null values
+        stats {dict} -- 'min', 'max', 'mean' and 'std' of a numerical column
+        hist {tuple} -- (counts, edges) of a numerical column, edges shared by every hue split
+        ecdf {tuple} -- (x, y) points of the ECDF of a numerical column, at most `n_points` of them
+        counts {pd.Series} -- count of every value of a categorical column, or of its `top_k` values
+        other {int} -- count of the values not in `counts`
+        by_hue {dict} -- hue value to the `ColumnProfile` of the rows having that hue
+    """
+
+    def __init__(self, name, kind, count, nulls, nunique, stats=None, hist=None, ecdf=None,
+                 counts=None, other=0, by_hue=None):
+        self.name = name
+        self.kind = kind
+        self.count = count
+        self.nulls = nulls
+        self.nunique = nunique
+        self.stats = stats or {}
+        self.hist = hist
+        self.ecdf = ecdf
+        self.counts = counts
+        self.other = other
+        self.by_hue = by_hue or {}
+
+    def __repr__(self):
+        return "ColumnProfile(name={!r}, kind={!r}, count={}, nulls={}, nunique={})".format(
+            self.name, self.kind, self.count, self.nulls, self.nunique
+        )
+
+    def quantile(self, q):
+        """Quantile(s) of a numerical column, interpolated on the ECDF points."""
+        x, y = self.ecdf
+        return np.interp(q, y, x)
+
+    def value_counts(self, normalize=False, dropna=True):
+        """Same as `pd.Series.value_counts(sort=False)` of a categorical column, nulls last if not `dropna`."""
+        counts = self.counts
+        if not dropna and self.nulls:
+            counts = pd.concat([counts, pd.Series([self.nulls], index=[np.nan])])
+        if normalize:
+            total = self.count + (0 if dropna else self.nulls)
+            counts = counts / total if total else counts.astype(np.float64)
+        return counts.rename(self.name)
+
+
+class Profile:
+    """
+    Summary of a dataframe computed by `profile_frame`, accepted instead of the dataframe by the
+    plotting functions.
+
+    Attributes
+    ----------
+        columns {dict} -- column name to `ColumnProfile`
+        n_rows {int} -- number of rows of the dataframe
+        hue {str} -- column the profiles are split by, None if not split
+        hue_values {list} -- sorted distinct values of `hue`
+    """
+
+    def __init__(self, columns, n_rows, hue=None, hue_values=None):
+        self.columns = columns
+        self.n_rows = n_rows
+        self.hue = hue
+        self.hue_values = hue_values or []
+
+    def __repr__(self):
+        return "Profile(n_rows={}, columns={}, hue={!r})".format(self.n_rows, list(self.columns), self.hue)
+
+    def __getitem__(self, col):
+        return self.columns[col]
+
+    def __contains__(self, col):
+        return col in self.columns
+
+    def check_hue(self, hue):
+        """Raise if the profile was not split by `hue`."""
+        if hue is not None and hue != self.hue:
+            raise ValueError("Profile is split by {!r}, not by {!r}.".format(self.hue, hue))
+
+
+def _group_offsets(sorted_codes, n_groups):
+    """Offsets of every group in codes sorted by group, group i is [offsets[i], offsets[i + 1])."""
+    return np.concatenate([[0], np.cumsum(np.bincount(sorted_codes, minlength=n_groups))])
+
+
+def _ecdf_points(values, n_points):
+    """
+    At most `n_points` (x, y) points of the ECDF of sorted `values`, at evenly spaced ranks.
+
+    Every point lies on the exact ECDF and consecutive points are at most 1 / (n_points - 1) apart
+    in y, so the curve drawn through them is within that distance of the full one.
+    """
+    n = len(values)
+    idx = np.unique(np.linspace(0, n - 1, min(n, n_points)).round().astype(np.int64))
+    x = values[idx]
+    return x, np.searchsorted(values, x, side='right') / n
+
+
+def _numerical_profile(name, values, nulls, edges, n_points):
+    """Profile of the sorted non-null `values` of a numerical column."""
+    n = len(values)
+    if n == 0:
+        return ColumnProfile(name, 'numerical', 0, nulls, 0, hist=(np.zeros(len(edges) - 1, dtype=np.int64), edges),
+                             ecdf=(np.empty(0), np.empty(0)))
+
+    # Histogram of sorted values from the position of every edge, last bin includes its right edge
+    positions = np.searchsorted(values, edges, side='left')
+    positions[-1] = n
+    hist = (np.diff(positions), edges)
+
+    ecdf = _ecdf_points(values, n_points)
+
+    stats = {'min': values[0], 'max': values[-1], 'mean': values.mean(),
+             'std': values.std(ddof=1) if n > 1 else np.nan}
+    nunique = int(np.count_nonzero(values[1:] != values[:-1])) + 1
+    return ColumnProfile(name, 'numerical', n, nulls, nunique, stats=stats, hist=hist, ecdf=ecdf)
+
+
+def _bin_edges(values, bins='auto', max_bins=100):
+    """np.histogram_bin_edges of `values`, with at most `max_bins` bins."""
+    if len(values) == 0:
+        return np.array([0., 1.])
+    edges = np.histogram_bin_edges(values, bins=bins)
+    if max_bins is not None and len(edges) > max_bins + 1:
+        edges = np.histogram_bin_edges(values, bins=max_bins)
+    return edges
+
+
+def _hue_split(hue_codes, n_hues):
+    """Rows with a hue ordered by hue, and the offsets of every hue in that order, see `_group_offsets`."""
+    rows = np.flatnonzero(hue_codes >= 0)
+    order = rows[np.argsort(hue_codes[rows], kind='stable')]
+    return order, _group_offsets(hue_codes[order], n_hues)
+
+
+def _profile_numerical(series, name, hue_split, hue_values, bins, max_bins, n_points):
+    values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+    notnull = ~np.isnan(values)
+    sorted_values = np.sort(values[notnull])
+    edges = _bin_edges(sorted_values, bins=bins, max_bins=max_bins)
+    res = _numerical_profile(name, sorted_values, len(values) - len(sorted_values), edges, n_points)
+    if hue_split is None:
+        return res
+
+    # Rows are already grouped by hue, every hue is a contiguous slice sorted on its own
+    order, offsets = hue_split
+    grouped = values[order]
+    for i, t in enumerate(hue_values):
+        v = grouped[offsets[i]:offsets[i + 1]]
+        isnull = np.isnan(v)
+        res.by_hue[t] = _numerical_profile(name, np.sort(v[~isnull]), int(isnull.sum()), edges, n_points)
+    return res
+
+
+def _top_counts(counts, top_k):
+    """Indices of the `top_k` largest counts, by decreasing count, found with a partial selection."""
+    if top_k is None or top_k >= len(counts):
+        return np.arange(len(counts))
+    top = np.argpartition(-counts, top_k - 1)[:top_k]
+    return top[np.argsort(-counts[top], kind='stable')]
+
+
+def _categorical_profile(name, counts, nulls, uniques, top_k):
+    top = _top_counts(counts, top_k)
+    if len(top) < len(counts):
+        kept = counts[top]
+        value_counts = pd.Series(kept, index=uniques.take(top))
+        other = int(counts.sum() - kept.sum())
+    else:
+        value_counts = pd.Series(counts, index=uniques)
+        other = 0
+    return ColumnProfile(name, 'categorical', int(counts.sum()), int(nulls),
+                         int(np.count_nonzero(counts)), counts=value_counts, other=other)
+
+
+def _profile_categorical(series, name, hue_codes, hue_values, top_k):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes, uniques = series.cat.codes.to_numpy(), series.cat.categories
+    else:
+        codes, uniques = pd.factorize(series)
+    k = len(uniques)
+    valid = codes >= 0
+    res = _categorical_profile(name, np.bincount(codes[valid], minlength=k), len(codes) - valid.sum(),
+                               uniques, top_k)
+    if hue_codes is None:
+        return res
+
+    # Counts of every (hue, value) pair with a single bincount
+    h = len(hue_values)
+    in_hue = hue_codes >= 0
+    both = in_hue & valid
+    counts = np.bincount(hue_codes[both] * k + codes[both], minlength=h * k).reshape(h, k)
+    nulls = np.bincount(hue_codes[in_hue & ~valid], minlength=h)
+    for i, t in enumerate(hue_values):
+        res.by_hue[t] = _categorical_profile(name, counts[i], nulls[i], uniques, top_k)
+    return res
+
+
+def profile_frame(data, cols_num=None, cols_cat=None, hue=None, bins='auto', max_bins=100, n_points=1000,
+                  top_k=None):
+    """
+    Summarize the columns of a dataframe once, for every plot of an EDA report.
+
+    Rows are grouped by hue once for all columns. Every numerical column is then sorted within
+    each hue: histograms, ECDF points, quantiles and distinct counts of every hue are read from
+    those sorted slices. Categorical
+    columns are factorized once and counted, per hue too, with a single bincount. The result can
+    be given instead of the dataframe to `distribution_gridplots`, `ecdf_numerical`,
+    `pdf_numerical`, `distplot_categorical`, `distplot_categorical_pretty`, `plot_share` and
+    `convert_to_categorical`.
+
+    Arguments
+    ---------
+        data {pd.DataFrame} -- dataframe without infinite values
+    Keyword Arguments
+    -----------------
+        cols_num {list} -- numerical columns, by default the numeric non-bool columns not in `cols_cat`
+        cols_cat {list} -- categorical columns, by default every other column
+        hue {str} -- column to split every profile by, e.g. the target
+        bins {int or str} -- bins of the histograms, see np.histogram_bin_edges
+        max_bins {int} -- largest number of bins of the histograms
+        n_points {int} -- number of ECDF points kept per numerical column and hue
+        top_k {int} -- number of values counted per categorical column, the rest is kept as
+            `other`, all values if None
+    Return
+    ------
+        profile {Profile}
+    """
+    if cols_num is None:
+        numeric = [col for col in data.columns
+                   if pd.api.types.is_numeric_dtype(data[col]) and not pd.api.types.is_bool_dtype(data[col])]
+        cols_num = [col for col in numeric if col not in (cols_cat or [])]
+    cols_num = list(cols_num)
+    if cols_cat is None:
+        cols_cat = [col for col in data.columns if col not in cols_num]
+    cols_num = [col for col in cols_num if col != hue]
+    cols_cat = [col for col in cols_cat if col != hue]
+
+    hue_codes, hue_values, hue_split = None, None, None
+    if hue is not None:
+        hue_codes, hue_values = pd.factorize(data[hue], sort=True)
+        hue_values = list(hue_values)
+        hue_split = _hue_split(hue_codes, len(hue_values))
+
+    columns = {}
+    for col in cols_num:
+        columns[col] = _profile_numerical(data[col], col, hue_split, hue_values, bins, max_bins, n_points)
+    for col in cols_cat:
+        columns[col] = _profile_categorical(data[col], col, hue_codes, hue_values, top_k)
+    return Profile(columns, len(data), hue=hue, hue_values=hue_values)
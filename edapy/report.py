@@ -0,0 +1,117 @@
+import html
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib.pyplot as plt
+import pandas as pd
+from . import plotting
+from .transformation import calendar_pivot, create_pivot
+from .utils import _n_jobs
+
+# Plot kinds of a report spec. Every function returns the figure first and does not block with
+# plt.show(). waffle_chart is given the pivot of the 'x' and 'y' columns of the spec, calendar_chart
+# the calendar pivot of its 'date' column.
+PLOT_KINDS = {
+    'pdf_numerical': plotting.pdf_numerical,
+    'ecdf_numerical': plotting.ecdf_numerical,
+    'distplot_categorical': plotting.distplot_categorical,
+    'distplot_categorical_pretty': plotting.distplot_categorical_pretty,
+    'plot_share': lambda data, **kwargs: plotting.plot_share(data, show=False, **kwargs),
+    'waffle_chart': lambda data, x, y, values=None, freq=None, **kwargs: plotting.waffle_chart(
+        create_pivot(data, x, y, values=values, freq=freq), show=False, **kwargs),
+    'calendar_chart': lambda data, date, values=None, **kwargs: plotting.waffle_chart(
+        calendar_pivot(data, date, values=values), show=False, **kwargs),
+}
+
+_worker = {}  # state of a pool worker: the data every figure of the report is drawn from
+
+
+def _init_worker(data):
+    plt.switch_backend('Agg')
+    _worker['data'] = data
+
+
+def _figure_name(i, item):
+    return item.get('name') or '{:03d}_{}'.format(i, item['kind'])
+
+
+def _render_task(args):
+    """Draw one figure of the spec, save it in every format and close it."""
+    name, item, output_dir, formats, dpi = args
+    kwargs = {key: value for key, value in item.items() if key not in ['kind', 'name']}
+    start = time.perf_counter()
+    fig = PLOT_KINDS[item['kind']](_worker['data'], **kwargs)[0]
+    files = []
+    try:
+        for fmt in formats:
+            filename = os.path.join(output_dir, '{}.{}'.format(name, fmt))
+            fig.savefig(filename, format=fmt, dpi=dpi)
+            files.append(filename)
+    finally:
+        plt.close(fig)
+    return name, item['kind'], time.perf_counter() - start, files
+
+
+def _write_index(output_dir, rows):
+    """index.html showing every figure of the report with its render time."""
+    body = []
+    for name, kind, seconds, files in rows:
+        body.append('<h2>{}</h2>\n<p>{} &middot; {:.2f}s</p>\n<img src="{}">'.format(
+            html.escape(name), html.escape(kind), seconds, html.escape(os.path.basename(files[0]))
+        ))
+    filename = os.path.join(output_dir, 'index.html')
+    with open(filename, 'w') as f:
+        f.write('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>EDA report</title></head>\n'
+                '<body>\n{}\n</body></html>\n'.format('\n'.join(body)))
+    return filename
+
+
+def render_report(data, spec, output_dir, formats=('png',), dpi=100, n_jobs=None):
+    """
+    Render many EDA figures to files, headless, in a pool of processes.
+
+    Every worker receives the data once and draws its figures on the Agg backend. Each figure is
+    closed as soon as it is saved, so memory does not grow with the number of figures.
+
+    Arguments
+    ---------
+        data {pd.DataFrame or edapy.profiling.Profile} -- data every figure is drawn from
+        spec {list} -- one dict per figure: 'kind', a key of `PLOT_KINDS`, an optional 'name' of
+            the files, and the keyword arguments of the plot function, e.g.
+            {'kind': 'pdf_numerical', 'cols_num': ['age', 'income'], 'hue': 'target'}
+        output_dir {str} -- directory of the files, created if needed
+    Keyword Arguments
+    -----------------
+        formats {list} -- 'png', 'svg', or any matplotlib format, and 'html' for an index.html
+            showing every figure
+        dpi {int} -- resolution of raster formats
+        n_jobs {int} -- number of worker processes, -1 for all cpus, None to render in this process
+    Return
+    ------
+        timings {pd.DataFrame} -- kind, render seconds and files of every figure, indexed by name
+    """
+    for item in spec:
+        if item['kind'] not in PLOT_KINDS:
+            raise ValueError(
+                "Unknown kind of plot {!r}. Supported kinds are {}.".format(item['kind'], list(PLOT_KINDS))
+            )
+    os.makedirs(output_dir, exist_ok=True)
+    fig_formats = [fmt for fmt in formats if fmt != 'html'] or ['svg']
+    tasks = [(_figure_name(i, item), item, output_dir, fig_formats, dpi) for i, item in enumerate(spec)]
+
+    n_jobs = _n_jobs(n_jobs)
+    if n_jobs > 1:
+        with ProcessPoolExecutor(n_jobs, initializer=_init_worker, initargs=(data,)) as pool:
+            rows = list(pool.map(_render_task, tasks))
+    else:
+        backend = plt.get_backend()
+        _init_worker(data)
+        try:
+            rows = [_render_task(task) for task in tasks]
+        finally:
+            _worker.clear()
+            plt.switch_backend(backend)
+
+    if 'html' in formats:
+        _write_index(output_dir, rows)
+    return pd.DataFrame(rows, columns=['name', 'kind', 'seconds', 'files']).set_index('name')
@@ -1,8 +1,13 @@
 from igramscraper.instagram import Instagram
 
 # Utilities, free proxies website https://openproxy.space/list/
-from itertools import cycle
-from .utils import batch
+import csv
+import json
+import os
+import queue
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm_notebook as tqdm
 
 
@@ -24,19 +29,196 @@ def get_account_metadata(username):
     return metadata
 
 
-def get_medias(metadata, filename, n=None):
+class ScrapeCheckpoint:
+    """
+    SQLite store of the scraping progress, so an interrupted scrape resumes where it stopped.
+
+    It records the medias written by `get_medias`, the medias whose comments are complete and the
+    identifier of every comment written by `get_all_media_comments`. Rows are written to the
+    output file and flushed before their identifiers are committed here.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS medias (identifier TEXT PRIMARY KEY);"
+            "CREATE TABLE IF NOT EXISTS done_medias (identifier TEXT PRIMARY KEY);"
+            "CREATE TABLE IF NOT EXISTS comments (identifier TEXT PRIMARY KEY, media_id TEXT);"
+        )
+        self.conn.commit()
+
+    def __repr__(self):
+        return "ScrapeCheckpoint(path={!r})".format(self.path)
+
+    def close(self):
+        self.conn.close()
+
+    def _ids(self, table):
+        return {row[0] for row in self.conn.execute("SELECT identifier FROM {}".format(table))}
+
+    def written_medias(self):
+        return self._ids('medias')
+
+    def done_medias(self):
+        return self._ids('done_medias')
+
+    def new_comments(self, comments):
+        """Comments whose identifier is not recorded yet, without duplicates."""
+        seen, res = set(), []
+        for comment in comments:
+            key = str(comment.identifier)
+            if key not in seen:
+                seen.add(key)
+                res.append(comment)
+        if not res:
+            return res
+        known = set()
+        keys = list(seen)
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            known.update(row[0] for row in self.conn.execute(
+                "SELECT identifier FROM comments WHERE identifier IN ({})".format(','.join('?' * len(chunk))), chunk
+            ))
+        return [comment for comment in res if str(comment.identifier) not in known]
+
+    def add_medias(self, identifiers):
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO medias VALUES (?)", [(str(i),) for i in identifiers])
+
+    def add_comments(self, media_id, comments):
+        """Record the comments written for a media and mark the media done, in one transaction."""
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO comments VALUES (?, ?)",
+                                  [(str(c.identifier), str(media_id)) for c in comments])
+            self.conn.execute("INSERT OR IGNORE INTO done_medias VALUES (?)", (str(media_id),))
+
+
+def _open_checkpoint(checkpoint):
+    if checkpoint is None or isinstance(checkpoint, ScrapeCheckpoint):
+        return checkpoint
+    return ScrapeCheckpoint(checkpoint)
+
+
+# Columns and types of the files written by `get_medias` and `get_all_media_comments`
+MEDIA_SCHEMA = {
+    'identifier': 'string', 'short_code': 'string', 'created_time': 'int64', 'caption': 'string',
+    'comments_count': 'int64', 'likes_count': 'int64', 'link': 'string', 'image_high_resolution_url': 'string',
+    'type': 'string',
+}
+COMMENT_SCHEMA = {'media_id': 'string', 'owner_id': 'string', 'owner_username': 'string', 'owner_comment': 'string'}
+
+
+class RecordWriter:
+    """
+    Buffered writer of rows with a fixed schema to csv, jsonl or parquet.
+
+    Rows are kept in memory and written `batch_size` at a time. csv is written with the csv module,
+    so values holding quotes, commas or newlines are escaped and the file loads with pd.read_csv.
+    Parquet (pyarrow) uses the types of the schema, one row group per batch, and an existing
+    parquet file cannot be appended to.
+
+    Arguments:
+        filename {str} -- output file
+        schema {dict} -- column name to 'string' or 'int64', in file order
+
+    Keyword Arguments:
+        file_format {str} -- 'csv', 'jsonl' or 'parquet', inferred from `filename` extension if None
+        batch_size {int} -- number of rows buffered before being written
+        append {bool} -- append to an existing csv or jsonl file instead of truncating it, a missing
+            or empty file is created as usual
+    """
+
+    def __init__(self, filename, schema, file_format=None, batch_size=10000, append=False):
+        file_format = file_format or os.path.splitext(filename)[1].lstrip('.').lower() or 'csv'
+        if file_format not in ['csv', 'jsonl', 'parquet']:
+            raise ValueError("Unknown file format. Supported formats are ['csv', 'jsonl', 'parquet'].")
+        if append and file_format == 'parquet' and os.path.exists(filename) and os.path.getsize(filename) > 0:
+            raise ValueError(
+                "Cannot append to the existing parquet file {}, use csv or jsonl to resume a scrape.".format(filename)
+            )
+        self.filename = filename
+        self.schema = schema
+        self.columns = list(schema)
+        self.file_format = file_format
+        self.batch_size = batch_size
+        self.n = 0
+        self._rows = []
+        self._writer = None
+
+        if file_format == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            types = {'string': pa.string(), 'int64': pa.int64()}
+            self._pa_schema = pa.schema([(col, types[t]) for col, t in schema.items()])
+            self._writer = pq.ParquetWriter(filename, self._pa_schema)
+            return
+        append = append and os.path.exists(filename) and os.path.getsize(filename) > 0
+        self._file = open(filename, 'a' if append else 'w', encoding="utf-8", newline='')
+        if file_format == 'csv':
+            self._writer = csv.writer(self._file)
+            if not append:
+                self._writer.writerow(self.columns)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, row):
+        """Buffer one row, a sequence in schema order."""
+        self._rows.append(row)
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def writerows(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def flush(self):
+        """Write the buffered rows and flush the file."""
+        rows, self._rows = self._rows, []
+        if self.file_format == 'parquet':
+            if rows:
+                import pyarrow as pa
+                arrays = [pa.array([row[i] for row in rows], type=self._pa_schema.field(i).type)
+                          for i in range(len(self.columns))]
+                self._writer.write_table(pa.Table.from_arrays(arrays, schema=self._pa_schema))
+        else:
+            if self.file_format == 'csv':
+                self._writer.writerows(rows)
+            else:
+                self._file.write(''.join(json.dumps(dict(zip(self.columns, row)), ensure_ascii=False) + '\n'
+                                         for row in rows))
+            self._file.flush()
+        self.n += len(rows)
+
+    def close(self):
+        self.flush()
+        if self.file_format == 'parquet':
+            self._writer.close()
+        else:
+            self._file.close()
+
+
+def get_medias(metadata, filename, n=None, checkpoint=None):
+    """
+    Get medias of an account and write them to a csv, jsonl or parquet file, see `MEDIA_SCHEMA`.
+
+    With `checkpoint`, a `ScrapeCheckpoint` or the path of its SQLite file, medias already written
+    by a previous run are skipped and the file is appended to instead of truncated.
+    """
     instagram = Instagram()
     if n is not None:
         medias = instagram.get_medias(metadata['username'], count=n)
     else:
         medias = instagram.get_medias(metadata['username'], count=metadata['media_count'])
 
-    cols = ['identifier', 'short_code', 'created_time', 'caption', 'comments_count',
-            'likes_count', 'link', 'image_high_resolution_url', 'type']
-    with open(filename, 'w', encoding="utf-8") as f:
-        header_str = ','.join(cols) + '\n'
-        f.write(header_str)
-        pbar_medias = tqdm(medias)
+    checkpoint = _open_checkpoint(checkpoint)
+    written = checkpoint.written_medias() if checkpoint is not None else set()
+    with RecordWriter(filename, MEDIA_SCHEMA, append=checkpoint is not None) as writer:
+        pbar_medias = tqdm([media for media in medias if str(media.identifier) not in written])
         for media in pbar_medias:
             pbar_medias.set_description("Getting medias")
             caption = media.caption
@@ -44,70 +226,138 @@ def get_medias(metadata, filename, n=None):
             caption = caption.replace('\n.', '')
             caption = caption.replace('\r', '')
             caption = caption.replace('\n', '')
-            data = [
+            writer.write([
                 str(media.identifier),
                 str(media.short_code),
-                str(media.created_time),
-                '"'+str(caption)+'"',
-                str(media.comments_count) if hasattr(media, 'commentsCount') else str(0),
-                str(media.likes_count),
+                int(media.created_time),
+                str(caption),
+                int(media.comments_count) if hasattr(media, 'commentsCount') else 0,
+                int(media.likes_count),
                 str(media.link),
                 str(media.image_high_resolution_url),
                 str(media.type)
-            ]
-            out_str = ','.join(data) + '\n'
-            f.write(out_str)
+            ])
+        writer.flush()
+        if checkpoint is not None:
+            checkpoint.add_medias(media.identifier for media in medias)
 
     return medias
 
 
-def get_all_media_comments(medias, filename, proxies):
-    # Initialize files
-    with open(filename, 'w', encoding="utf-8") as f:
-        f.write("media_id,owner_id,owner_username,owner_comment\n")
+class _ProxyClient:
+    """Client bound to one proxy, with its own rate limit and failure backoff."""
 
-    # Rotating Proxies
-    proxy_cycle = cycle(proxies)
-    proxy_str = next(proxy_cycle)
-    proxy = {}
-    proxy['http'] = 'http://'+proxy_str
-    proxy['https'] = 'https://'+proxy_str
+    def __init__(self, proxy_str, client_factory, min_interval=1., backoff=2., max_backoff=300.):
+        self.proxy_str = proxy_str
+        self.client = client_factory(proxy_str)
+        self.min_interval = min_interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.ready_at = 0.
+        self.failures = 0
+
+    def wait(self):
+        delay = self.ready_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def succeeded(self):
+        self.failures = 0
+        self.ready_at = time.monotonic() + self.min_interval
+
+    def failed(self):
+        self.failures += 1
+        self.ready_at = time.monotonic() + min(self.backoff * 2 ** (self.failures - 1), self.max_backoff)
+
+
+def _instagram_client(proxy_str):
     instagram = Instagram()
-    instagram.set_proxies(proxy)
-
-    # Create Batches
-    batches = []
-    for x in batch(medias, 10):
-        batches.append(x)
-
-    # Do the scraping.....
-    pbar_batches = tqdm(batches)
-    for b in pbar_batches:
-        pbar_batches.set_description('Media')
-        pbar_comment = tqdm(b)
-        for media in pbar_comment:
-            pbar_comment.set_description('Comment')
-            # Try maximum 10 proxies, otherwise skip
-            for _ in range(10):
-                try:
-                    comments = instagram.get_media_comments_by_id(media.identifier, 10000)
-                    for comment in comments['comments']:
-                        comment_text = comment.text.strip('\n')
-                        comment_text = comment_text.replace('\r', '')
-                        comment_text = comment_text.replace('\n', ' ')
-                        with open(filename, 'a', encoding="utf-8") as f:
-                            f.write('{},{},{},"{}"\n'.format(
-                                media.identifier,
-                                comment.owner.identifier,
-                                comment.owner.username,
-                                comment_text)
-                            )
-                    break
-                except Exception as e:
-                    print(e)
-                    proxy_str = next(proxy_cycle)
-                    proxy = {}
-                    proxy['http'] = 'http://'+proxy_str
-                    proxy['https'] = 'https://'+proxy_str
-                    instagram = Instagram()
-                    instagram.set_proxies(proxy)
+    instagram.set_proxies({'http': 'http://'+proxy_str, 'https': 'https://'+proxy_str})
+    return instagram
+
+
+def _fetch_comments(media, clients, max_retries=10, count=10000):
+    """
+    Comments of one media, trying up to `max_retries` times with the proxy client ready first.
+    A client is used by one thread at a time. None if every try failed.
+    """
+    for _ in range(max_retries):
+        _, i, client = clients.get()
+        client.wait()
+        try:
+            comments = client.client.get_media_comments_by_id(media.identifier, count)
+        except Exception as e:
+            print(client.proxy_str, e)
+            client.failed()
+            clients.put((client.ready_at, i, client))
+            continue
+        client.succeeded()
+        clients.put((client.ready_at, i, client))
+        return comments['comments']
+    return None
+
+
+def _comment_row(media, comment):
+    comment_text = comment.text.strip('\n')
+    comment_text = comment_text.replace('\r', '')
+    comment_text = comment_text.replace('\n', ' ')
+    return [str(media.identifier), str(comment.owner.identifier), str(comment.owner.username), comment_text]
+
+
+def get_all_media_comments(medias, filename, proxies, n_workers=None, min_interval=1., backoff=2.,
+                           max_retries=10, client_factory=None, checkpoint=None):
+    """
+    Scrape the comments of every media concurrently, one thread per proxy by default.
+
+    Every proxy has one client, reused for the whole run, used by one thread at a time and at most
+    once every `min_interval` seconds. A failing proxy backs off exponentially, from `backoff`
+    seconds, and the media is retried on the proxy ready first. Comments are written by this
+    thread only, to one buffered file.
+
+    Arguments:
+        medias {list} -- medias from `get_medias`
+        filename {str} -- output csv, jsonl or parquet file, see `COMMENT_SCHEMA`
+        proxies {list} -- 'host:port' strings, free proxies website https://openproxy.space/list/
+
+    Keyword Arguments:
+        n_workers {int} -- number of threads, the number of proxies by default
+        min_interval {float} -- seconds between two requests of a proxy
+        backoff {float} -- seconds a proxy waits after its first failure, doubled on each next one
+        max_retries {int} -- tries per media, the media is skipped after
+        client_factory {callable} -- client from a proxy string, an Instagram bound to it by default,
+            e.g. a stub with `get_media_comments_by_id` to run offline
+        checkpoint {ScrapeCheckpoint or str} -- checkpoint or path of its SQLite file. Medias done
+            by a previous run are skipped, comments already written are not written again, and the
+            file is appended to instead of truncated
+
+    Returns:
+        skipped {list} -- identifiers of the medias skipped after `max_retries` failures
+    """
+    client_factory = client_factory or _instagram_client
+    clients = queue.PriorityQueue()
+    for i, proxy_str in enumerate(proxies):
+        clients.put((0., i, _ProxyClient(proxy_str, client_factory, min_interval=min_interval, backoff=backoff)))
+
+    checkpoint = _open_checkpoint(checkpoint)
+    if checkpoint is not None:
+        done = checkpoint.done_medias()
+        medias = [media for media in medias if str(media.identifier) not in done]
+
+    skipped = []
+    with RecordWriter(filename, COMMENT_SCHEMA, append=checkpoint is not None) as writer, \
+            ThreadPoolExecutor(n_workers or len(proxies)) as pool:
+        futures = {pool.submit(_fetch_comments, media, clients, max_retries): media for media in medias}
+        pbar = tqdm(as_completed(futures), total=len(futures))
+        pbar.set_description('Media')
+        for future in pbar:
+            media, comments = futures[future], future.result()
+            if comments is None:
+                skipped.append(media.identifier)
+                continue
+            if checkpoint is not None:
+                comments = checkpoint.new_comments(comments)
+            writer.writerows(_comment_row(media, comment) for comment in comments)
+            if checkpoint is not None:
+                writer.flush()
+                checkpoint.add_comments(media.identifier, comments)
+    return skipped
@@ -0,0 +1,351 @@
+import numpy as np
+import pandas as pd
+from .profiling import ColumnProfile, Profile
+from .transformation import _iter_chunks
+
+
+class QuantileSketch:
+    """
+    KLL quantile sketch of a numerical column, fed chunk by chunk and mergeable across processes.
+
+    Items are kept in compactors of growing weight. When a compactor is full it is sorted and every
+    other item, from a random offset, moves up with twice the weight. Memory is O(k log(n / k)).
+
+    Error bounds: a quantile has a rank error, |estimated rank - true rank| / n, of about 1.7 / k
+    with high probability, 0.85% for the default k=200, independent of n and of how the data was
+    split between the merged sketches. min and max are exact.
+    """
+
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.compactors = [np.empty(0)]
+        self.rng = np.random.default_rng(seed)
+
+    def __repr__(self):
+        return "QuantileSketch(k={}, n={}, size={})".format(self.k, self.n, sum(len(c) for c in self.compactors))
+
+    def _capacity(self, h):
+        depth = len(self.compactors) - h - 1
+        return max(int(np.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def _compress(self):
+        full = True
+        while full:
+            full = False
+            for h in range(len(self.compactors)):
+                if len(self.compactors[h]) <= self._capacity(h):
+                    continue
+                full = True
+                if h + 1 == len(self.compactors):
+                    self.compactors.append(np.empty(0))
+                items = np.sort(self.compactors[h])
+                leftover, items = items[len(items) - len(items) % 2:], items[:len(items) - len(items) % 2]
+                self.compactors[h + 1] = np.concatenate([self.compactors[h + 1], items[self.rng.integers(2)::2]])
+                self.compactors[h] = leftover
+
+    def update(self, values):
+        """Add the non-null values of an array or Series."""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        self.n += len(values)
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self.compactors[0] = np.concatenate([self.compactors[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """Add the values summarized by another sketch of the same k."""
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append(np.empty(0))
+        for h, items in enumerate(other.compactors):
+            self.compactors[h] = np.concatenate([self.compactors[h], items])
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _weighted(self):
+        """Sorted items and their cumulative weights."""
+        items = np.concatenate(self.compactors)
+        weights = np.concatenate([np.full(len(c), 2 ** h, dtype=np.int64) for h, c in enumerate(self.compactors)])
+        order = np.argsort(items, kind='stable')
+        return items[order], np.cumsum(weights[order])
+
+    def cdf(self, x):
+        """Estimated fraction of values <= x."""
+        items, cum = self._weighted()
+        if len(items) == 0:
+            return np.full(np.shape(x), np.nan)
+        pos = np.searchsorted(items, x, side='right')
+        return np.where(pos > 0, cum[np.maximum(pos - 1, 0)], 0) / cum[-1]
+
+    def quantile(self, q):
+        """Estimated q-quantile(s), q in [0, 1]."""
+        items, cum = self._weighted()
+        if len(items) == 0:
+            return np.full(np.shape(q), np.nan)
+        q = np.asarray(q, dtype=np.float64)
+        res = items[np.minimum(np.searchsorted(cum, q * cum[-1], side='left'), len(items) - 1)]
+        res = np.where(q <= 0, self.min, np.where(q >= 1, self.max, res))
+        return res if res.ndim else res.item()
+
+
+class DistinctSketch:
+    """
+    HyperLogLog distinct counter, fed chunk by chunk and mergeable across processes.
+
+    Values are hashed with pd.util.hash_pandas_object, so the same value must have the same dtype
+    in every chunk (1 and 1.0 are different values). Memory is 2^p bytes.
+
+    Error bounds: the relative standard error of `nunique` is 1.04 / sqrt(2^p), 0.81% for the
+    default p=14. Small counts use linear counting and are nearly exact.
+    """
+
+    def __init__(self, p=14):
+        self.p = p
+        self.registers = np.zeros(2 ** p, dtype=np.uint8)
+
+    def __repr__(self):
+        return "DistinctSketch(p={}, nunique~{:.0f})".format(self.p, self.nunique)
+
+    def update(self, series):
+        """Add the non-null values of a Series."""
+        series = pd.Series(series).dropna()
+        if len(series) == 0:
+            return self
+        h = pd.util.hash_pandas_object(series, index=False).to_numpy()
+        idx = (h >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = h & np.uint64((1 << (64 - self.p)) - 1)
+
+        # Exact bit length of the remaining bits, the rank is the position of the first set bit
+        bits = np.zeros(len(rest), dtype=np.int64)
+        for s in [32, 16, 8, 4, 2, 1]:
+            big = rest >= np.uint64(1 << s)
+            bits[big] += s
+            rest[big] >>= np.uint64(s)
+        bits += rest > 0
+        rank = (64 - self.p - bits + 1).astype(np.uint8)
+        np.maximum.at(self.registers, idx, rank)
+        return self
+
+    def merge(self, other):
+        """Add the values counted by another sketch of the same p."""
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    @property
+    def nunique(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(2.0 ** -self.registers.astype(np.float64))
+        zeros = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)
+        return estimate
+
+
+class TopKSketch:
+    """
+    Space-saving heavy hitters of a categorical column, fed chunk by chunk and mergeable across
+    processes. At most k counters are kept.
+
+    Error bounds: every kept count overestimates the true count by at most `errors[value]`, itself
+    at most n / k. Every value more frequent than n / k is kept.
+    """
+
+    def __init__(self, k=100):
+        self.k = k
+        self.n = 0
+        self.counts = pd.Series(dtype=np.int64)
+        self.errors = pd.Series(dtype=np.int64)
+
+    def __repr__(self):
+        return "TopKSketch(k={}, n={}, size={})".format(self.k, self.n, len(self.counts))
+
+    def _floor(self):
+        """Count a value absent from a full summary may have had."""
+        return self.counts.min() if len(self.counts) >= self.k else 0
+
+    def _combine(self, counts, errors, n, floor):
+        keys = self.counts.index.union(counts.index)
+        own_floor = self._floor()
+        self.counts = (self.counts.reindex(keys, fill_value=own_floor) + counts.reindex(keys, fill_value=floor))
+        self.errors = (self.errors.reindex(keys, fill_value=own_floor) + errors.reindex(keys, fill_value=floor))
+        self.n += n
+        if len(self.counts) > self.k:
+            top = np.argpartition(-self.counts.to_numpy(), self.k - 1)[:self.k]
+            self.counts, self.errors = self.counts.iloc[top], self.errors.iloc[top]
+        order = np.argsort(-self.counts.to_numpy(), kind='stable')
+        self.counts, self.errors = self.counts.iloc[order], self.errors.iloc[order]
+
+    def update(self, series):
+        """Add the non-null values of a Series, counted exactly within the chunk."""
+        counts = pd.Series(series).value_counts(sort=False)
+        self._combine(counts, pd.Series(0, index=counts.index, dtype=np.int64), int(counts.sum()), 0)
+        return self
+
+    def merge(self, other):
+        """Add the values summarized by another sketch."""
+        self._combine(other.counts, other.errors, other.n, other._floor())
+        return self
+
+
+class ColumnSketch:
+    """
+    Sketches of one column: count of nulls, QuantileSketch and DistinctSketch of a numerical
+    column, DistinctSketch and TopKSketch of a categorical one. Mergeable like its sketches.
+    """
+
+    def __init__(self, name, kind, k=200, p=14, top_k=100, seed=None):
+        self.name = name
+        self.kind = kind
+        self.nulls = 0
+        self.distinct = DistinctSketch(p)
+        self.quantiles = QuantileSketch(k, seed=seed) if kind == 'numerical' else None
+        self.top = TopKSketch(top_k) if kind == 'categorical' else None
+
+    def __repr__(self):
+        return "ColumnSketch(name={!r}, kind={!r}, count={}, nulls={})".format(
+            self.name, self.kind, self.count, self.nulls
+        )
+
+    @property
+    def count(self):
+        return self.quantiles.n if self.quantiles is not None else self.top.n
+
+    def update(self, series):
+        self.nulls += int(series.isna().sum())
+        self.distinct.update(series)
+        if self.quantiles is not None:
+            self.quantiles.update(series.to_numpy(dtype=np.float64, na_value=np.nan))
+        else:
+            self.top.update(series)
+        return self
+
+    def merge(self, other):
+        if other.kind != self.kind:
+            raise ValueError(
+                "Cannot merge the {} sketch of {!r} with a {} one.".format(self.kind, self.name, other.kind)
+            )
+        self.nulls += other.nulls
+        self.distinct.merge(other.distinct)
+        if self.quantiles is not None:
+            self.quantiles.merge(other.quantiles)
+        else:
+            self.top.merge(other.top)
+        return self
+
+    def to_profile(self, bins=50, n_points=1000):
+        """Approximate `ColumnProfile`, for the plotting functions, from the sketches."""
+        nunique = int(round(self.distinct.nunique))
+        if self.quantiles is None:
+            counts = self.top.counts
+            return ColumnProfile(self.name, 'categorical', self.count, self.nulls, nunique,
+                                 counts=counts, other=int(self.count - counts.sum()))
+        q = self.quantiles
+        if q.n == 0:
+            return ColumnProfile(self.name, 'numerical', 0, self.nulls, 0,
+                                 hist=(np.zeros(bins, dtype=np.int64), np.linspace(0, 1, bins + 1)),
+                                 ecdf=(np.empty(0), np.empty(0)))
+        edges = np.linspace(q.min, q.max, bins + 1)
+        cdf = q.cdf(edges)
+        cdf[0], cdf[-1] = 0, 1
+        hist = (np.round(np.diff(cdf) * q.n).astype(np.int64), edges)
+        probs = np.linspace(0, 1, n_points)
+        ecdf = (q.quantile(probs), probs)
+        stats = {'min': q.min, 'max': q.max}
+        return ColumnProfile(self.name, 'numerical', q.n, self.nulls, nunique, stats=stats, hist=hist, ecdf=ecdf)
+
+
+def sketch_frame(data, cols_num=None, cols_cat=None, sketches=None, k=200, p=14, top_k=100, seed=None):
+    """
+    Update the sketches of the columns of one chunk, creating them on the first call.
+
+    Arguments
+    ---------
+        data {pd.DataFrame} -- one chunk of the data
+    Keyword Arguments
+    -----------------
+        cols_num {list} -- numerical columns, by default the numeric non-bool columns when
+            `cols_cat` is not given either
+        cols_cat {list} -- categorical columns, by default every other column
+        sketches {dict} -- output of a previous call, updated in place
+        k, p, top_k {int} -- sizes of QuantileSketch, DistinctSketch and TopKSketch
+        seed {int} -- seed of the QuantileSketch random compactions
+    Return
+    ------
+        sketches {dict} -- column name to `ColumnSketch`
+    """
+    sketches = {} if sketches is None else sketches
+    if not sketches:
+        if cols_num is None and cols_cat is None:
+            cols_num = [col for col in data.columns
+                        if pd.api.types.is_numeric_dtype(data[col]) and not pd.api.types.is_bool_dtype(data[col])]
+        cols_num = list(cols_num or [])
+        if cols_cat is None:
+            cols_cat = [col for col in data.columns if col not in cols_num]
+        for col in cols_num:
+            sketches[col] = ColumnSketch(col, 'numerical', k=k, p=p, top_k=top_k, seed=seed)
+        for col in cols_cat:
+            sketches[col] = ColumnSketch(col, 'categorical', k=k, p=p, top_k=top_k, seed=seed)
+    for col, sketch in sketches.items():
+        sketch.update(data[col])
+    return sketches
+
+
+def sketch_file(path, cols_num=None, cols_cat=None, chunksize=1000000, k=200, p=14, top_k=100, seed=None,
+                **kwargs):
+    """
+    Sketch the columns of a csv or parquet file too large for memory, one chunk at a time.
+
+    Sketches of different files, or of parts of a file read by different processes, are combined
+    with `merge_sketches`.
+
+    Arguments
+    ---------
+        path {str} -- .csv (or any pd.read_csv file) or .parquet file
+    Keyword Arguments
+    -----------------
+        chunksize {int} -- number of rows read at a time
+        **kwargs -- see `sketch_frame`, the rest is passed to pd.read_csv or to pyarrow
+            ParquetFile.iter_batches
+    Return
+    ------
+        sketches {dict} -- column name to `ColumnSketch`
+    """
+    sketches = {}
+    for chunk in _iter_chunks(path, chunksize=chunksize, **kwargs):
+        sketch_frame(chunk, cols_num=cols_num, cols_cat=cols_cat, sketches=sketches, k=k, p=p, top_k=top_k,
+                     seed=seed)
+    return sketches
+
+
+def merge_sketches(*sketches):
+    """Merge the outputs of `sketch_frame` or `sketch_file` into the first one."""
+    res = sketches[0]
+    for other in sketches[1:]:
+        for col, sketch in other.items():
+            if col in res:
+                res[col].merge(sketch)
+            else:
+                res[col] = sketch
+    return res
+
+
+def sketch_profile(sketches, bins=50, n_points=1000):
+    """
+    Approximate `Profile` from sketches, accepted by the plotting functions like the output of
+    `profile_frame`. Quantiles, ECDF and histograms have the rank error of QuantileSketch, nunique
+    the error of DistinctSketch, categorical counts the error of TopKSketch, with the tail in
+    `other`. Profiles from sketches are not split by hue.
+    """
+    columns = {col: sketch.to_profile(bins=bins, n_points=n_points) for col, sketch in sketches.items()}
+    n_rows = max([s.count + s.nulls for s in sketches.values()], default=0)
+    return Profile(columns, n_rows)
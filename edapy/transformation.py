@@ -1,10 +1,18 @@
 import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 
 
-def convert_to_categorical(df, cat_limit=20):
+def convert_to_categorical(df, cat_limit=20, profile=None):
+    """
+    Cast every column of df having at most cat_limit distinct values to category, in place.
+
+    profile, an edapy.profiling.Profile of df, gives the distinct counts of the columns it covers
+    without rescanning them.
+    """
     for col in df.columns:
-        if (df[col].nunique() <= cat_limit):
+        nunique = profile[col].nunique if profile is not None and col in profile else df[col].nunique()
+        if (nunique <= cat_limit):
             df[col] = df[col].astype('category')
             print("Column {} casted to categorical".format(col))
 
@@ -16,52 +24,496 @@ def reduce_ordinal_category(series, bins, values):
     return temp.map(mapper)
 
 
-def outlier_removal(X, method='Tukey', k=3):
-    Q3 = X.quantile(0.75)
-    Q1 = X.quantile(0.25)
-    IQR = Q3 - Q1
-    upper = Q3 + 3*IQR
-    lower = Q1 - 3*IQR
-    res = (X < lower) | (X > upper)
-    return res
+# Default `k` of every method of `fit_outlier_bounds`
+OUTLIER_K = {
+    'Tukey': 3.,  # Q1 - k * IQR, Q3 + k * IQR, 3 being Tukey's "far out"
+    'zscore': 3.,  # mean -/+ k * std
+    'MAD': 3.5,  # median -/+ k * 1.4826 * MAD, the modified z-score cut of Iglewicz and Hoaglin
+}
+
+
+def _by_list(by):
+    """Group columns of the outlier functions as a list, None if not grouped."""
+    return None if by is None else [by] if isinstance(by, str) else list(by)
+
+
+def _group_keys(X, by):
+    """Group of every row, indexed like the groups of X.groupby(by): an Index for one column."""
+    return pd.Index(X[by[0]]) if len(by) == 1 else pd.MultiIndex.from_frame(X[by])
+
+
+def _outlier_cols(X, cols, by):
+    if cols is not None:
+        return list(cols)
+    by = by or []
+    numeric = [col for col in X.columns
+               if pd.api.types.is_numeric_dtype(X[col]) and not pd.api.types.is_bool_dtype(X[col])]
+    return [col for col in numeric if col not in by]
+
+
+def fit_outlier_bounds(X, cols=None, method='Tukey', k=None, by=None, sketches=None):
+    """
+    Lower and upper outlier bounds of many columns at once, optionally per group.
+
+    Every statistic of every column and group comes from one groupby pass: quantile for Tukey,
+    mean and std for zscore, and two medians for MAD. Give the bounds to `apply_outlier_bounds` to
+    flag new chunks without computing them again.
+
+    Arguments
+    ---------
+        X {pd.DataFrame} -- data the bounds are fitted on
+    Keyword Arguments
+    -----------------
+        cols {list} -- columns to bound, by default the numeric non-bool columns not in `by`
+        method {str} -- 'Tukey' [Q1 - k * IQR, Q3 + k * IQR], 'zscore' [mean -/+ k * std] or
+            'MAD' [median -/+ k * 1.4826 * MAD]
+        k {float} -- width of the bounds, `OUTLIER_K` of the method if None
+        by {str or list} -- column(s) of the groups bounded separately, e.g. a segment
+        sketches {dict} -- column name to edapy.sketches.ColumnSketch or QuantileSketch, e.g.
+            built over data larger than memory, giving Q1 and Q3 instead of X. Tukey only, without
+            `by`, their rank error applies to the bounds
+    Return
+    ------
+        bounds {pd.DataFrame} -- 'lower' and 'upper' of every column, indexed by column, or by
+            (group, column) if `by`
+    """
+    if method not in OUTLIER_K:
+        raise ValueError("Unknown method. Supported methods are {}.".format(list(OUTLIER_K)))
+    k = OUTLIER_K[method] if k is None else k
+    by = _by_list(by)
+    cols = _outlier_cols(X, cols, by)
+
+    if sketches is not None:
+        if method != 'Tukey' or by is not None:
+            raise ValueError("Sketches only give the quantiles of Tukey bounds, without groups.")
+        q1, q3 = [pd.Series({col: getattr(sketches[col], 'quantiles', sketches[col]).quantile(q) for col in cols})
+                  for q in [0.25, 0.75]]
+        low, high = q1, q3
+    else:
+        values = X[cols].astype(np.float64)
+        if by is None:
+            grouped = values.groupby(np.zeros(len(values), dtype=np.int8))
+        else:
+            grouped = values.groupby(_group_keys(X, by))
+        if method == 'Tukey':
+            q = grouped.quantile([0.25, 0.75])
+            low, high = q.xs(0.25, level=-1), q.xs(0.75, level=-1)
+        elif method == 'zscore':
+            low = high = grouped.mean()
+            spread = grouped.std()
+        else:
+            low = high = grouped.median()
+            deviation = (values - grouped.transform('median')).abs()
+            spread = 1.4826 * deviation.groupby(grouped.ngroup()).median()
+            spread.index = low.index
+
+    if method == 'Tukey':
+        iqr = high - low
+        lower, upper = low - k * iqr, high + k * iqr
+    else:
+        lower, upper = low - k * spread, high + k * spread
+
+    if by is None:
+        lower, upper = [x.iloc[0] if isinstance(x, pd.DataFrame) else x for x in [lower, upper]]
+        bounds = pd.DataFrame({'lower': lower, 'upper': upper})
+    else:
+        bounds = pd.DataFrame({'lower': lower.stack(future_stack=True), 'upper': upper.stack(future_stack=True)})
+    return bounds
+
+
+def apply_outlier_bounds(X, bounds, by=None):
+    """
+    Flag the values of X outside fitted bounds, e.g. chunk by chunk over a stream.
+
+    Arguments
+    ---------
+        X {pd.DataFrame} -- data to flag, with the bounded columns and the `by` columns
+        bounds {pd.DataFrame} -- output of `fit_outlier_bounds`
+    Keyword Arguments
+    -----------------
+        by {str or list} -- same as given to `fit_outlier_bounds`
+    Return
+    ------
+        mask {pd.DataFrame} -- True for outliers, one column per bounded column. Null values and
+            rows of a group not seen in the fit are never outliers
+    """
+    by = _by_list(by)
+    if by is None:
+        cols = list(bounds.index)
+        lower = bounds['lower'].to_numpy(dtype=np.float64)[None, :]
+        upper = bounds['upper'].to_numpy(dtype=np.float64)[None, :]
+    else:
+        cols = list(bounds.index.get_level_values(-1).unique())
+        lower, upper = [bounds[b].unstack(-1).reindex(columns=cols) for b in ['lower', 'upper']]
+        # Bounds of the group of every row, a row of nulls for unseen groups
+        idx = lower.index.get_indexer(_group_keys(X, by))
+        lower, upper = [np.vstack([x.to_numpy(dtype=np.float64), np.full((1, len(cols)), np.nan)])[idx]
+                        for x in [lower, upper]]
+    values = X[cols].to_numpy(dtype=np.float64, na_value=np.nan)
+    return pd.DataFrame((values < lower) | (values > upper), index=X.index, columns=cols)
+
+
+def outlier_removal(X, method='Tukey', k=None, sketches=None, by=None):
+    """
+    Flag outliers of a Series, or of every numerical column of a DataFrame.
+
+    See `fit_outlier_bounds` for `method`, `k`, `sketches` and `by`. A sketch of the Series X is
+    given as is, the sketches of a DataFrame as a dict of column name to sketch.
+    Return the boolean mask, a Series for a Series X.
+
+    Example
+    -------
+        >>> outlier_removal(X, by='segment').equals(outlier_removal(X, by=['segment']))
+        True
+    """
+    if isinstance(X, pd.Series):
+        name = X.name if X.name is not None else 0
+        if sketches is not None:
+            sketches = {name: sketches}
+        mask = outlier_removal(X.to_frame(name), method=method, k=k, sketches=sketches)
+        return mask[name].rename(X.name)
+    bounds = fit_outlier_bounds(X, method=method, k=k, by=by, sketches=sketches)
+    return apply_outlier_bounds(X, bounds, by=by)
+
+
+# Default policy of `reduce_mem_usage`
+MEM_POLICY = {
+    'float_rtol': 0.,  # relative error allowed by the float round-trip, 0 keeps values exact
+    'float16': False,  # allow float16, unsafe for sums and means even when values round-trip
+    'unsigned': False,  # allow uint8..uint64 for columns without negative values, unsafe for differences
+    'nullable': True,  # turn integer-valued floats with nulls into nullable Int8..Int64
+    'cat_limit': 20,  # string columns with at most `cat_limit` distinct values become categories
+    'cat_ratio': 0.5,  # ... or with at most `cat_ratio` distinct values per row
+}
+
+
+def _smallest_int(c_min, c_max, unsigned=False, nullable=False):
+    """Smallest integer dtype holding [c_min, c_max], a pandas nullable one if `nullable`."""
+    candidates = [np.int8, np.uint8, np.int16, np.uint16, np.int32, np.uint32, np.int64, np.uint64]
+    for t in candidates:
+        if not unsigned and np.dtype(t).kind == 'u':
+            continue
+        if np.iinfo(t).min <= c_min and c_max <= np.iinfo(t).max:
+            name = np.dtype(t).name
+            if nullable:
+                name = 'UInt' + name[4:] if name.startswith('uint') else name.capitalize()
+            return pd.api.types.pandas_dtype(name)
+    return None
+
+
+def _reduced_dtype(series, policy):
+    """Smallest dtype `series` can be cast to under `policy` without losing values, None to keep it."""
+    dtype = series.dtype
+    if dtype.kind == 'b':
+        return None
+
+    if dtype.kind in 'iuf':
+        extension = isinstance(dtype, pd.api.extensions.ExtensionDtype)
+        has_null = bool(series.isna().any())
+        values = series.dropna().to_numpy() if has_null else series.to_numpy()
+        if len(values) == 0:
+            return None
+        if extension:
+            values = values.astype(dtype.numpy_dtype)
+        c_min, c_max = values.min(), values.max()
+
+        candidates = []
+        integer = dtype.kind in 'iu' or (np.isfinite(c_min) and np.isfinite(c_max) and (np.mod(values, 1) == 0).all())
+        if integer and (extension or not has_null or policy['nullable']):
+            candidates.append(_smallest_int(c_min, c_max, unsigned=policy['unsigned'], nullable=extension or has_null))
+        if dtype.kind == 'f':
+            for t in ([np.float16] if policy['float16'] and not extension else []) + [np.float32]:
+                with np.errstate(over='ignore', invalid='ignore'):
+                    back = values.astype(t).astype(values.dtype)
+                if np.allclose(back, values, rtol=policy['float_rtol'], atol=0, equal_nan=True):
+                    candidates.append(pd.api.types.pandas_dtype('Float32') if extension and t == np.float32
+                                      else np.dtype(t))
+                    break
+        candidates = [t for t in candidates if t is not None and t.itemsize < dtype.itemsize]
+        return min(candidates, key=lambda t: t.itemsize) if candidates else None
+
+    if dtype.kind == 'O' or isinstance(dtype, (pd.StringDtype, pd.CategoricalDtype)):
+        if isinstance(dtype, pd.CategoricalDtype):
+            return None
+        n_unique = series.nunique()
+        if n_unique <= policy['cat_limit'] or n_unique <= policy['cat_ratio'] * len(series):
+            return 'category'
+    return None
+
+
+def reduce_mem_usage(df, policy=None, verbose=True, report=False):
+    """
+    Downcast every column of `df` in place to the smallest dtype that keeps its values.
+
+    Integers go to the smallest integer dtype, bounds included, unsigned ones only if allowed. Floats holding only
+    integers go to integers, nullable ones if there are nulls. Other floats go to float32, or
+    float16 if allowed, only if every value round-trips within `float_rtol`. Low-cardinality
+    string columns become categories. Each column is cast once and replaced in `df`, the rest of
+    the frame is not copied.
 
+    Arguments
+    ---------
+        df {pd.DataFrame} -- dataframe modified in place
+    Keyword Arguments
+    -----------------
+        policy {dict} -- overrides of `MEM_POLICY`
+        verbose {bool} -- print every cast and the total reduction
+        report {bool} -- True to also return the report of every column
+    Return
+    ------
+        df {pd.DataFrame} -- the same `df`, so `df = reduce_mem_usage(df)` keeps working
+        report {pd.DataFrame} -- if `report`, per column dtype before and after, bytes before, after
+            and saved
+    """
+    policy = dict(MEM_POLICY, **(policy or {}))
+    unknown = set(policy) - set(MEM_POLICY)
+    if unknown:
+        raise ValueError("Unknown policy keys {}. Supported keys are {}.".format(sorted(unknown), list(MEM_POLICY)))
 
-def reduce_mem_usage(df, verbose=True):
-    numerics = ['int16', 'int32', 'int64', 'float16', 'float32', 'float64']
-    start_mem = df.memory_usage().sum() / 1024**2
+    rows = []
     for col in df.columns:
-        col_type = df[col].dtypes
-        if col_type in numerics:
-            c_min = df[col].min()
-            c_max = df[col].max()
-            if str(col_type)[:3] == 'int':
-                if c_min > np.iinfo(np.int8).min and c_max < np.iinfo(np.int8).max:
-                    df[col] = df[col].astype(np.int8)
-                elif c_min > np.iinfo(np.int16).min and c_max < np.iinfo(np.int16).max:
-                    df[col] = df[col].astype(np.int16)
-                elif c_min > np.iinfo(np.int32).min and c_max < np.iinfo(np.int32).max:
-                    df[col] = df[col].astype(np.int32)
-                elif c_min > np.iinfo(np.int64).min and c_max < np.iinfo(np.int64).max:
-                    df[col] = df[col].astype(np.int64)
-            else:
-                if c_min > np.finfo(np.float16).min and c_max < np.finfo(np.float16).max:
-                    df[col] = df[col].astype(np.float16)
-                elif c_min > np.finfo(np.float32).min and c_max < np.finfo(np.float32).max:
-                    df[col] = df[col].astype(np.float32)
-                else:
-                    df[col] = df[col].astype(np.float64)
-    end_mem = df.memory_usage().sum() / 1024**2
+        before = df[col].dtype
+        bytes_before = df[col].memory_usage(index=False, deep=True)
+        dtype = _reduced_dtype(df[col], policy)
+        if dtype is not None:
+            df[col] = df[col].astype(dtype)
+            if verbose:
+                print("Column {} casted from {} to {}".format(col, before, df[col].dtype))
+        bytes_after = df[col].memory_usage(index=False, deep=True)
+        rows.append((col, before, df[col].dtype, bytes_before, bytes_after, bytes_before - bytes_after))
+
+    res = pd.DataFrame(rows, columns=['column', 'dtype_before', 'dtype_after',
+                                      'bytes_before', 'bytes_after', 'bytes_saved']).set_index('column')
     if verbose:
+        start_mem = res['bytes_before'].sum() / 1024**2
+        end_mem = res['bytes_after'].sum() / 1024**2
         print(
             'Mem. usage decreased to {:5.2f} Mb ({:.1f}% reduction)'.format(
-                end_mem, 100 * (start_mem - end_mem) / start_mem
+                end_mem, 100 * (start_mem - end_mem) / start_mem if start_mem else 0
             )
         )
-    return df
+    return (df, res) if report else df
+
+
+def _iter_chunks(path, chunksize=1000000, **kwargs):
+    """Yield dataframes of at most `chunksize` rows read from a csv or parquet (pyarrow) file."""
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for record_batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, **kwargs):
+            yield record_batch.to_pandas()
+    else:
+        for chunk in pd.read_csv(path, chunksize=chunksize, **kwargs):
+            yield chunk
+
+
+def _update_column_stats(stats, series, cat_limit):
+    """Merge the statistics of one chunk of a column into `stats`, see `get_dtype_plan`."""
+    kind = series.dtype.kind
+    if kind not in 'biufO':
+        kind = 'skip'
+    if stats['kind'] != kind and stats['kind'] is not None:
+        # Order of generality of the dtypes seen so far: bool < int < float < object
+        rank = {'b': 0, 'u': 1, 'i': 1, 'f': 2, 'O': 3, 'skip': 4}
+        kind = max(stats['kind'], kind, key=rank.get)
+    stats['kind'] = kind
+
+    notnull = series.dropna()
+    stats['has_null'] |= len(notnull) < len(series)
+    if kind in 'iuf' and series.dtype.kind in 'iuf' and len(notnull):
+        values = notnull.values
+        stats['min'] = min(stats['min'], values.min())
+        stats['max'] = max(stats['max'], values.max())
+        if series.dtype.kind == 'f':
+            stats['integer'] &= bool(np.isfinite(values).all() and (np.mod(values, 1) == 0).all())
+        if stats['float32']:
+            with np.errstate(over='ignore', invalid='ignore'):
+                back = values.astype(np.float32).astype(np.float64)
+            stats['float32'] = bool(np.allclose(back, values.astype(np.float64), rtol=MEM_POLICY['float_rtol'],
+                                                atol=0, equal_nan=True))
+
+    # Distinct values are kept only up to `cat_limit`, past it the column is not a category
+    if stats['uniques'] is not None:
+        stats['uniques'].update(notnull.unique())
+        if len(stats['uniques']) > cat_limit:
+            stats['uniques'] = None
+
+
+def _plan_dtype(stats):
+    """Smallest dtype holding every value seen in the column, None to leave the column as read."""
+    kind, has_null = stats['kind'], stats['has_null']
+    if kind == 'b':
+        return 'boolean' if has_null else 'bool'
+    if kind in 'iuf' and stats['integer']:
+        if stats['min'] > stats['max']:  # only null values
+            return None
+        return _smallest_int(stats['min'], stats['max'], nullable=has_null)
+    if kind == 'f':
+        return np.dtype(np.float32) if stats['float32'] else np.dtype(np.float64)
+    if kind == 'O' and stats['uniques'] is not None:
+        try:
+            categories = sorted(stats['uniques'])
+        except TypeError:
+            categories = list(stats['uniques'])
+        return pd.CategoricalDtype(categories)
+    return None
+
+
+def get_dtype_plan(path, cat_limit=20, chunksize=1000000, usecols=None, verbose=True, **kwargs):
+    """
+    Pick the smallest dtype of every column of a csv or parquet file, reading it chunk by chunk.
+
+    Per-column min, max, nulls, integer-ness and distinct values (up to `cat_limit`) are collected
+    over the chunks, so the memory used is one chunk, never the whole file at full precision.
+    Floats are planned as float32 only if every chunk round-trips within `MEM_POLICY['float_rtol']`.
+
+    Arguments
+    ---------
+        path {str} -- .csv (or any pd.read_csv file) or .parquet file
+    Keyword Arguments
+    -----------------
+        cat_limit {int} -- string columns with at most `cat_limit` distinct values become categories
+        chunksize {int} -- number of rows read at a time
+        usecols {list} -- columns to read, all by default
+        verbose {bool} -- print the number of rows and the plan
+        **kwargs -- passed to pd.read_csv, or to pyarrow ParquetFile.iter_batches
+    Return
+    ------
+        plan {dict} -- column to dtype, among int8..int64, nullable Int8..Int64, float32, float64,
+            bool, boolean and category. Columns kept as read (e.g. datetime, high-cardinality
+            strings) are left out. Pass it to `read_reduced`, or as `dtype` to pd.read_csv.
+    """
+    if usecols is not None:
+        kwargs['columns' if path.endswith('.parquet') else 'usecols'] = usecols
+
+    stats, n_rows = {}, 0
+    for chunk in _iter_chunks(path, chunksize=chunksize, **kwargs):
+        n_rows += len(chunk)
+        for col in chunk.columns:
+            if col not in stats:
+                stats[col] = {'kind': None, 'has_null': False, 'min': np.inf, 'max': -np.inf,
+                              'integer': True, 'float32': True, 'uniques': set()}
+            _update_column_stats(stats[col], chunk[col], cat_limit)
+
+    plan = {col: _plan_dtype(s) for col, s in stats.items()}
+    plan = {col: dtype for col, dtype in plan.items() if dtype is not None}
+    if verbose:
+        print("Read {} rows of {} columns, {} columns to downcast".format(n_rows, len(stats), len(plan)))
+        for col, dtype in plan.items():
+            print("Column {} planned as {}".format(col, dtype))
+    return plan
+
+
+def read_reduced(path, plan=None, chunksize=1000000, **kwargs):
+    """
+    Read a csv or parquet file with the dtypes of `get_dtype_plan`.
+
+    A csv is parsed directly into the planned dtypes. A parquet file is cast batch by batch, so
+    the frame never exists in float64 or object form as a whole.
+
+    Arguments
+    ---------
+        path {str} -- .csv (or any pd.read_csv file) or .parquet file
+    Keyword Arguments
+    -----------------
+        plan {dict} -- output of `get_dtype_plan`, computed here if None
+        chunksize {int} -- number of rows read at a time for parquet, and for the plan
+        **kwargs -- passed to pd.read_csv, or to pyarrow ParquetFile.iter_batches
+    Return
+    ------
+        df {pd.DataFrame}
+    """
+    if plan is None:
+        plan = get_dtype_plan(path, chunksize=chunksize, verbose=False, **kwargs)
+    if not path.endswith('.parquet'):
+        return pd.read_csv(path, dtype=plan, **kwargs)
+    chunks = [chunk.astype({col: dtype for col, dtype in plan.items() if col in chunk.columns})
+              for chunk in _iter_chunks(path, chunksize=chunksize, **kwargs)]
+    return pd.concat(chunks, ignore_index=True)
+
+
+def _pivot_codes(keys):
+    """Sorted factorization of pivot keys, rows with a null key get -1."""
+    codes, uniques = pd.factorize(keys, sort=True)
+    return codes.astype(np.int64, copy=False), pd.Index(uniques)
+
+
+def _accumulate(row_codes, col_codes, weights, shape, sparse=False):
+    """Sum `weights` (ones if None) of every (row, col) pair, np.bincount if dense, else COO."""
+    keep = (row_codes >= 0) & (col_codes >= 0)
+    row_codes, col_codes = row_codes[keep], col_codes[keep]
+    if weights is not None:
+        weights = weights[keep]
+    if not sparse:
+        return np.bincount(row_codes * shape[1] + col_codes, weights=weights,
+                           minlength=shape[0] * shape[1]).reshape(shape)
+    data = np.ones(len(row_codes), dtype=np.int64) if weights is None else weights
+    return sp.coo_matrix((data, (row_codes, col_codes)), shape=shape).tocsr()
+
+
+def _pivot_frame(matrix, index, columns, sparse=False):
+    if sparse:
+        return pd.DataFrame.sparse.from_spmatrix(matrix, index=index, columns=columns)
+    return pd.DataFrame(matrix, index=index, columns=columns)
+
+
+def create_pivot(data, x, y, values=None, freq=None, sparse=False):
+    """
+    Count (or sum `values`) of every (y, x) pair, y as rows and x as columns, zero if absent.
+
+    Both keys are factorized once and the pairs accumulated with np.bincount, or into a
+    scipy.sparse matrix if `sparse`, so only the pairs present cost memory.
+
+    Arguments
+    ---------
+        data {pd.DataFrame}
+        x {str} -- column of the pivot columns
+        y {str} -- column of the pivot rows
+    Keyword Arguments
+    -----------------
+        values {str} -- column summed for every pair, rows are counted if None
+        freq {str} -- bucket the datetime column x into periods of `freq` first, e.g. 'W' or 'M'
+        sparse {bool} -- True to return a frame of pandas sparse columns, built from a CSR matrix
+    Return
+    ------
+        df {pd.DataFrame} -- pivot with sorted index and columns, nulls left out
+    """
+    keys = data[x].dt.to_period(freq) if freq is not None else data[x]
+    col_codes, columns = _pivot_codes(keys)
+    row_codes, index = _pivot_codes(data[y])
+    weights = data[values].to_numpy(dtype=np.float64, na_value=0.) if values is not None else None
+    matrix = _accumulate(row_codes, col_codes, weights, (len(index), len(columns)), sparse=sparse)
+    return _pivot_frame(matrix, index.rename(y), columns.rename(x), sparse=sparse)
+
+
+def calendar_pivot(data, date, values=None):
+    """
+    Pivot of a datetime column for a calendar heatmap: weekdays as rows, weeks as columns.
 
+    Days are computed from the datetime64 integers in a single pass, weekday being
+    (days + 3) % 7 since 1970-01-01 is a Thursday, and every week between the first and the last
+    date gets a column, empty or not, so years of events are laid out without gaps.
 
-def create_pivot(data, x, y):
-    g = data.groupby([y, x], as_index=False).size().reset_index(name='count')
-    df = g.pivot(columns=x, index=y, values="count")
-    df.fillna(0, inplace=True)
-    return df
+    Arguments
+    ---------
+        data {pd.DataFrame}
+        date {str} -- datetime column of the events
+    Keyword Arguments
+    -----------------
+        values {str} -- column summed for every day, events are counted if None
+    Return
+    ------
+        df {pd.DataFrame} -- 7 rows, Mon to Sun, one column per week named by its Monday.
+            Pass it to `edapy.plotting.waffle_chart`
+    """
+    dates = data[date]
+    valid = dates.notna().to_numpy()
+    days = dates.to_numpy(dtype='datetime64[ns]')[valid].astype('datetime64[D]').astype(np.int64)
+    weekday = (days + 3) % 7
+    week = (days - weekday + 3) // 7  # weeks since the Monday 1969-12-29
+    first = week.min() if len(week) else 0
+    n_weeks = int(week.max() - first + 1) if len(week) else 0
+    weights = data[values].to_numpy(dtype=np.float64, na_value=0.)[valid] if values is not None else None
+    matrix = _accumulate(weekday, week - first, weights, (7, n_weeks))
+    mondays = pd.to_datetime((first + np.arange(n_weeks)) * 7 - 3, unit='D').date
+    index = pd.Index(['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'], name='weekday')
+    return pd.DataFrame(matrix, index=index, columns=pd.Index(mondays, name='week'))
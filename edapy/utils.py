@@ -1,5 +1,9 @@
+import os
 import numpy as np
 import pandas as pd
+from matplotlib.artist import Artist
+from matplotlib.text import Text
+from matplotlib.transforms import Bbox
 
 
 def batch(l, b=1, n=None):
@@ -62,20 +66,143 @@ def batch(l, b=1, n=None):
             yield l[ndx:min(ndx + b, m)]
 
 
+def _n_jobs(n_jobs):
+    """Number of worker processes, negative values count back from the number of cpus."""
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        return max((os.cpu_count() or 1) + 1 + n_jobs, 1)
+    return n_jobs
+
+
 def get_unique_tuple(a):
     return [tuple(x) for x in set(map(frozenset, a))]
 
 
-def lookup_date(s):
+def _guess_datetime_format(value):
+    try:
+        from pandas.tseries.api import guess_datetime_format
+    except ImportError:  # pandas < 2.2
+        from pandas.core.tools.datetimes import guess_datetime_format
+    return guess_datetime_format(value) if isinstance(value, str) else None
+
+
+class DateCache:
+    """
+    Bounded LRU cache of parsed dates, shared across calls and files.
+
+    Every call infers its format from its own first string, the way pd.to_datetime does, unless
+    `format` is given. The distinct values of a call are looked up in the cache with one
+    Index.get_indexer per format, and the ones not found are parsed in one vectorized
+    pd.to_datetime call and appended. Entries are kept per format, so a call never reuses a date
+    parsed with another format. When most values of a call are distinct, e.g. timestamps to the
+    second, caching them would cost more than it saves: they are parsed without being stored.
+    `hits` and `misses` count distinct values looked up.
+
+    Keyword Arguments:
+        maxsize {int} -- number of dates kept, the least recently used calls are evicted first
+        format {str} -- strftime format of every value, inferred per call if None
+        unique_ratio {float} -- calls with more distinct values than `unique_ratio` times their
+            length skip the cache
+        **kwargs -- passed to pd.to_datetime
+    """
+
+    def __init__(self, maxsize=100000, format=None, unique_ratio=0.5, **kwargs):
+        self.maxsize = maxsize
+        self.format = format
+        self.unique_ratio = unique_ratio
+        self.kwargs = kwargs
+        self.hits = 0
+        self.misses = 0
+        self._tick = 0
+        self._cache = {}  # format -> (values, dates, last call using each date)
+
+    def __repr__(self):
+        return "DateCache(maxsize={}, size={}, hits={}, misses={}, format={!r})".format(
+            self.maxsize, len(self), self.hits, self.misses, self.format
+        )
+
+    def __len__(self):
+        return sum(len(values) for values, _, _ in self._cache.values())
+
+    def clear(self):
+        self._cache.clear()
+        self.hits = self.misses = 0
+
+    def _parse(self, values, format):
+        if format is not None:
+            try:
+                return pd.DatetimeIndex(pd.to_datetime(values, format=format, **self.kwargs))
+            except (ValueError, TypeError):
+                pass
+        try:
+            return pd.DatetimeIndex(pd.to_datetime(values, **self.kwargs))
+        except (ValueError, TypeError):  # values of several formats
+            return pd.DatetimeIndex(pd.to_datetime(values, format='mixed', **self.kwargs))
+
+    def _evict(self):
+        n_over = len(self) - self.maxsize
+        if n_over <= 0:
+            return
+        ticks = np.concatenate([used for _, _, used in self._cache.values()])
+        cutoff = np.sort(ticks)[n_over - 1]  # calls up to this one are dropped
+        for format, (values, dates, used) in list(self._cache.items()):
+            keep = used > cutoff
+            if keep.any():
+                self._cache[format] = (values[keep], dates[keep], used[keep])
+            else:
+                del self._cache[format]
+
+    def parse(self, s):
+        """Parse a Series of dates, only the values not in the cache are parsed."""
+        s = pd.Series(s)
+        if pd.api.types.is_datetime64_any_dtype(s):
+            return s
+        codes, uniques = pd.factorize(s)
+        format = self.format
+        if format is None and len(uniques):
+            strings = uniques[:100][[isinstance(u, str) for u in uniques[:100]]]
+            format = _guess_datetime_format(strings[0]) if len(strings) else None
+
+        if len(uniques) > self.unique_ratio * len(s):
+            self.misses += len(uniques)
+            parsed = self._parse(uniques, format)
+        else:
+            self._tick += 1
+            values, dates, used = self._cache.get(format, (pd.Index([]), pd.DatetimeIndex([]), np.empty(0, np.int64)))
+            idx = values.get_indexer(uniques)
+            missing = idx < 0
+            self.misses += int(missing.sum())
+            self.hits += int(len(idx) - missing.sum())
+            if missing.any():
+                idx[missing] = len(values) + np.arange(missing.sum())
+                values = values.append(pd.Index(uniques[missing]))
+                new = self._parse(uniques[missing], format)
+                dates = dates.append(new) if len(dates) else new
+                used = np.concatenate([used, np.zeros(missing.sum(), dtype=np.int64)])
+            used[idx] = self._tick
+            self._cache[format] = (values, dates, used)
+            parsed = dates.take(idx)
+            self._evict()
+
+        res = parsed.take(codes, allow_fill=True, fill_value=pd.NaT)
+        return pd.Series(res, index=s.index, name=s.name)
+
+
+_date_cache = DateCache()
+
+
+def lookup_date(s, cache=None):
     """
     This is an extremely fast approach to datetime parsing.
     For large data, the same dates are often repeated. Rather than
     re-parse these, we store all unique dates, parse them, and
     use a lookup to convert all dates.
+    Parsed dates are kept in a DateCache, by default one of 100000 dates shared by every call, so
+    dates repeated across calls and files are parsed once.
     Example: df['date']=lookup_date(df['date'])
     """
-    dates = {date: pd.to_datetime(date) for date in s.unique()}
-    return s.map(dates)
+    return (_date_cache if cache is None else cache).parse(s)
 
 
 def sample_numpy(A, n, replace=False):
@@ -105,8 +232,84 @@ def trunc_string(s, limit=100):
     return s[:limit]+'...' if len(s) > limit else s
 
 
-def autolabel(ax, normalized=True, barh=False, **kwargs):
+class TextCollection(Artist):
+    """
+    Many text labels drawn by a single artist, in data coordinates by default.
+
+    One Text is reused to draw every label, so no artist is created per label. For tight_layout,
+    the extent is measured on the outermost and the longest labels only, so layout cost does not
+    grow with the number of labels either.
+    """
+
+    def __init__(self, x, y, texts, **kwargs):
+        super().__init__()
+        self._x = np.asarray(x, dtype=np.float64)
+        self._y = np.asarray(y, dtype=np.float64)
+        self._texts = np.asarray(texts, dtype=str)
+        self._text = Text(**kwargs)
+        self.set_clip_on(False)
+
+    def _draw_one(self, i, renderer, text=None):
+        self._text.set_figure(self.figure)
+        self._text.set_transform(self.get_transform())
+        self._text.set_position((self._x[i], self._y[i]))
+        self._text.set_text(self._texts[i] if text is None else text)
+
+    def get_window_extent(self, renderer=None):
+        if len(self._texts) == 0:
+            return Bbox.null()
+        xy = self.get_transform().transform(np.column_stack([self._x, self._y]))
+        right = np.argmax(xy[:, 0])
+        picks = {np.argmin(xy[:, 0]), right, np.argmin(xy[:, 1]), np.argmax(xy[:, 1])}
+        bboxes = []
+        for i in picks:
+            self._draw_one(i, renderer)
+            bboxes.append(self._text.get_window_extent(renderer))
+        self._draw_one(right, renderer, text=max(self._texts, key=len))
+        bboxes.append(self._text.get_window_extent(renderer))
+        return Bbox.union(bboxes)
+
+    def get_tightbbox(self, renderer=None):
+        return self.get_window_extent(renderer)
+
+    def draw(self, renderer):
+        if not self.get_visible():
+            return
+        for i in range(len(self._texts)):
+            self._draw_one(i, renderer)
+            self._text.draw(renderer)
+        self.stale = False
+
+
+def bulk_text(ax, x, y, texts, max_labels=None, values=None, **kwargs):
+    """
+    Add the labels `texts` at (x, y) to `ax` as one `TextCollection`.
+
+    With `max_labels`, only the labels of the `max_labels` largest `values` (default y) are kept,
+    found with a partial selection.
+    """
+    x, y, texts = np.asarray(x), np.asarray(y), np.asarray(texts, dtype=str)
+    if max_labels is not None and len(texts) > max_labels:
+        values = np.abs(np.asarray(y if values is None else values, dtype=np.float64))
+        keep = np.sort(np.argpartition(-values, max_labels - 1)[:max_labels])
+        x, y, texts = x[keep], y[keep], texts[keep]
+    collection = TextCollection(x, y, texts, **kwargs)
+    ax.add_artist(collection)
+    return collection
+
+
+def autolabel(ax, normalized=True, barh=False, bulk=False, max_labels=None, **kwargs):
     # Attach some text labels.
+    if bulk or max_labels is not None:
+        # Positions and strings as arrays, drawn by a single artist
+        rects = np.array([[r.get_x(), r.get_y(), r.get_width(), r.get_height()] for r in ax.patches]).reshape(-1, 4)
+        values = rects[:, 2] if barh else rects[:, 3]
+        if normalized:
+            texts = np.char.add(np.round(values * 100, 2).astype(str), '%')
+        else:
+            texts = np.char.mod('%.0f', values)
+        return bulk_text(ax, rects[:, 0] + rects[:, 2] / 2., rects[:, 1] + rects[:, 3] / 2., texts,
+                         max_labels=max_labels, values=values, ha='center', va='center', **kwargs)
     for rect in ax.patches:
         if barh:
             if normalized: